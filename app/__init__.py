@@ -1,10 +1,14 @@
 import os
+import sqlite3
 
 from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import config
 
 db = SQLAlchemy()
@@ -12,6 +16,16 @@ migrate = Migrate()
 csrf = CSRFProtect()
 
 
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys (and so 'ON DELETE CASCADE')
+    # unless it is enabled for every connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
 def bad_request(e):
     return render_template('errors/400.html'), 400
 
@@ -34,6 +48,11 @@ def create_app(config_name: str = 'production'):
 
     app.config.from_object(config[config_name])
 
+    # Requests come through proxies, see PROXY_FIX_HOPS
+    hops = app.config['PROXY_FIX_HOPS']
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
     # Apply handling of status code with custom templates
     app.register_error_handler(400, bad_request)
     app.register_error_handler(404, page_not_found)
@@ -42,10 +61,25 @@ def create_app(config_name: str = 'production'):
 
     # Import of 'models' module is necessary
     # so that Flask-Migrate detects changes there
-    from . import models, main, auth
+    from . import models, main, auth, sitemap, feeds
+    from . import metrics, profiler, rendering, compression, reputation
+    from . import sqlite, load_shedding
+    from .duplicates import duplicate_detector
+    from .related import related_questions
+    from .search_cache import search_cache
+    from .shared_cache import shared_cache
+    from .slow_queries import slow_query_log
+    from .view_counter import view_counter
+    from .tag_suggestions import tag_suggestions
+    from .tag_synonyms import tag_synonyms
+
+    # Reject requests when worker is overloaded, before
+    # any other hook runs
+    load_shedding.init_app(app)
 
     # Initialize database and migrations
     db.init_app(app)
+    sqlite.init_app(app)
     migrate.init_app(app, db)
 
     login_manager = LoginManager()
@@ -54,7 +88,23 @@ def create_app(config_name: str = 'production'):
 
     @login_manager.user_loader
     def login_user(user_id):
-        return models.User.query.get(int(user_id))
+        return auth.load_user(int(user_id))
+
+    rendering.init_app(app)
+    reputation.init_app(app)
+    duplicate_detector.init_app(app)
+    related_questions.init_app(app)
+    search_cache.init_app(app)
+    shared_cache.init_app(app)
+    view_counter.init_app(app)
+    tag_suggestions.init_app(app)
+    tag_synonyms.init_app(app)
+
+    # Collect request, database and template timings for '/metrics'
+    metrics.init_app(app)
+    profiler.init_app(app)
+    slow_query_log.init_app(app)
+    compression.init_app(app)
 
     # Enable CSRF-protection globally for application
     csrf.init_app(app)
@@ -62,5 +112,7 @@ def create_app(config_name: str = 'production'):
     # Register blueprints
     app.register_blueprint(main.bp)
     app.register_blueprint(auth.bp)
+    app.register_blueprint(sitemap.bp)
+    app.register_blueprint(feeds.bp)
 
     return app
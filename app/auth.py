@@ -2,11 +2,34 @@ import re
 from flask import Blueprint, render_template, redirect, url_for, request, flash
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, login_required, logout_user, current_user
+from sqlalchemy.orm import make_transient_to_detached
 from .models import User
 from . import db
+from .shared_cache import shared_cache
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+USER_KEY = 'user:{}'
+
+
+def load_user(user_id: int) -> User | None:
+    # User of every request is kept in cache shared by workers.
+    # Hash of password is not cached, it is loaded when it is read
+    values = shared_cache.get(USER_KEY.format(user_id))
+    if values is None:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            shared_cache.set(USER_KEY.format(user_id), {
+                'id': user.id, 'username': user.username,
+                'email': user.email, 'reputation': user.reputation})
+        return user
+
+    # Cached user is added to session as loaded from
+    # database, so that it can be changed and committed
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
 
 def username_is_valid(username: str) -> bool:
     # Function to check if user uses only valid
@@ -213,6 +236,7 @@ def change_profile():
         current_user.username = username
         current_user.email = email
         db.session.commit()
+        shared_cache.delete(USER_KEY.format(current_user.id))
 
         flash('You successfully updated your profile', 'success')
         return redirect(url_for('main.index'))
@@ -0,0 +1,93 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressedBodyCache:
+    # Compressed bodies are kept in small LRU cache keyed by encoding
+    # and hash of uncompressed body. Hashing is many times cheaper than
+    # compressing, so page that is served the same way many times
+    # (from a page cache or just because it did not change)
+    # is compressed only once
+
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            body = self._items.get(key)
+            if body is not None:
+                self._items.move_to_end(key)
+            return body
+
+    def set(self, key, body: bytes):
+        with self._lock:
+            self._items[key] = body
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+def choose_encoding() -> str | None:
+    accept = request.accept_encodings
+    if brotli is not None and accept.quality('br') > 0:
+        return 'br'
+    if accept.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(
+            body, quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(body, compresslevel=current_app.config['COMPRESS_LEVEL'],
+                         mtime=0)
+
+
+def compress_response(response):
+    config = current_app.config
+    if response.direct_passthrough or response.is_streamed \
+            or response.status_code != 200 \
+            or 'Content-Encoding' in response.headers \
+            or response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    cache = current_app.extensions['compression_cache']
+    key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+    compressed = cache.get(key)
+    if compressed is None:
+        compressed = compress(body, encoding)
+        cache.set(key, compressed)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    if not app.config['COMPRESS_ENABLED']:
+        return
+
+    app.extensions['compression_cache'] = CompressedBodyCache(
+        app.config['COMPRESS_CACHE_SIZE'])
+    app.after_request(compress_response)
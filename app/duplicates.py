@@ -0,0 +1,199 @@
+import hashlib
+import re
+import struct
+import threading
+import time
+
+from sqlalchemy import select
+
+from . import db
+from .indexes import BackgroundIndex
+from .models import Question
+
+
+# Signature of 64 MinHash values split into 16 bands of 4 values:
+# questions whose titles have Jaccard similarity of about 0.5 share
+# at least one band with probability 1 - (1 - 0.5 ** 4) ** 16 = 0.64,
+# with similarity 0.8 it is 0.999
+PERMUTATIONS = 64
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+
+# Every shingle is hashed once into 64 independent 32-bit values,
+# i-th value plays the role of i-th random permutation
+SHINGLE_HASHES = struct.Struct(f'<{PERMUTATIONS}I')
+
+WORD = re.compile(r'\w+')
+
+
+def shingles(title: str, details: str | None) -> set[str]:
+    # Words and pairs of adjacent words of title
+    # and of the beginning of details
+    words = WORD.findall(title.lower())
+    if details:
+        words += WORD.findall(details[:500].lower())
+    result = set(words)
+    result.update(f'{first} {second}'
+                  for first, second in zip(words, words[1:]))
+    return result
+
+
+def signature(question_shingles: set[str]) -> tuple[int, ...]:
+    # Minimum of every hash value over all shingles,
+    # minimums are taken by builtins, not in Python loop
+    return tuple(map(min, zip(*[
+        SHINGLE_HASHES.unpack(hashlib.shake_128(shingle.encode()).
+                              digest(SHINGLE_HASHES.size))
+        for shingle in question_shingles
+    ])))
+
+
+def bands(signature: tuple[int, ...]):
+    for band in range(BANDS):
+        yield band, signature[band * ROWS:(band + 1) * ROWS]
+
+
+class DuplicateDetector(BackgroundIndex):
+    # In-memory MinHash/LSH index of questions, one per worker.
+    # Similar questions are looked up only among questions that share
+    # a band of signature with the new one, so lookup does not depend
+    # on number of questions. Index is built in batches in background
+    # when worker starts, patched when questions are posted, updated
+    # or deleted in this worker and rebuilt in background from time
+    # to time to see changes of others
+
+    def __init__(self):
+        super().__init__()
+        self.threshold = 0.5
+        self.count = 5
+        self.batch_size = 1000
+        self._lock = threading.Lock()
+        self._signatures = {}
+        self._titles = {}
+        self._buckets = {}
+        # Changes made while index is rebuilt, None when it is not
+        self._changes = None
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.threshold = app.config.get('DUPLICATES_THRESHOLD',
+                                        self.threshold)
+        self.count = app.config.get('DUPLICATES_COUNT', self.count)
+        self.rebuild_interval = app.config.get(
+            'DUPLICATES_REBUILD_INTERVAL', self.rebuild_interval)
+
+    def rebuild(self):
+        # New structures are built without the lock and swapped in at
+        # once, changes this worker made in the meantime are applied
+        # to them first, so they are not lost until the next rebuild
+        with self._lock:
+            self._changes = []
+        try:
+            signatures, titles, buckets = self._load()
+        except BaseException:
+            with self._lock:
+                self._changes = None
+            raise
+
+        with self._lock:
+            self._signatures = signatures
+            self._titles = titles
+            self._buckets = buckets
+            changes, self._changes = self._changes, None
+            for change in changes:
+                self._apply(*change)
+            self._built_at = time.monotonic()
+
+    def _load(self):
+        signatures = {}
+        titles = {}
+        buckets = {}
+        for question_id, title, details in db.session.execute(
+                select(Question.id, Question.title, Question.details)).\
+                yield_per(self.batch_size):
+            question_shingles = shingles(title or '', details)
+            if not question_shingles:
+                continue
+            question_signature = signature(question_shingles)
+            signatures[question_id] = question_signature
+            titles[question_id] = title
+            for band in bands(question_signature):
+                buckets.setdefault(band, set()).add(question_id)
+        return signatures, titles, buckets
+
+    def similar(self, title: str, details: str | None = None,
+                exclude: int | None = None) -> list[tuple[int, str, float]]:
+        # Returns (id, title, estimated similarity) of questions
+        # similar to the given title and details, nothing
+        # until index is built for the first time
+        question_shingles = shingles(title, details)
+        if not question_shingles:
+            return []
+        query_signature = signature(question_shingles)
+
+        self.refresh()
+        with self._lock:
+            candidates = set()
+            for band in bands(query_signature):
+                candidates.update(self._buckets.get(band, ()))
+            candidates.discard(exclude)
+
+            results = []
+            for question_id in candidates:
+                other = self._signatures[question_id]
+                similarity = sum(
+                    1 for first, second in zip(query_signature, other)
+                    if first == second) / PERMUTATIONS
+                if similarity >= self.threshold:
+                    results.append((question_id, self._titles[question_id],
+                                    similarity))
+
+        results.sort(key=lambda result: (-result[2], -result[0]))
+        return results[:self.count]
+
+    def update(self, question_id: int, title: str, details: str | None):
+        if self._built_at is None and self._changes is None:
+            return
+
+        question_shingles = shingles(title, details)
+        question_signature = \
+            signature(question_shingles) if question_shingles else None
+        self._change(question_id, title, question_signature)
+
+    def remove(self, question_id: int):
+        self._change(question_id, None, None)
+
+    def _change(self, question_id: int, title: str | None,
+                question_signature: tuple[int, ...] | None):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((question_id, title,
+                                      question_signature))
+            if self._built_at is not None:
+                self._apply(question_id, title, question_signature)
+
+    def _apply(self, question_id: int, title: str | None,
+               question_signature: tuple[int, ...] | None):
+        # Question without signature is removed from index
+        self._remove(question_id)
+        if question_signature is None:
+            return
+        self._signatures[question_id] = question_signature
+        self._titles[question_id] = title
+        for band in bands(question_signature):
+            self._buckets.setdefault(band, set()).add(question_id)
+
+    def _remove(self, question_id: int):
+        old_signature = self._signatures.pop(question_id, None)
+        self._titles.pop(question_id, None)
+        if old_signature is None:
+            return
+        for band in bands(old_signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(question_id)
+                if not bucket:
+                    del self._buckets[band]
+
+
+duplicate_detector = DuplicateDetector()
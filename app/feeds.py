@@ -0,0 +1,151 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import (Blueprint, Response, abort, current_app, render_template,
+                   request, url_for)
+
+from . import db
+from .main import parse_tags_path, tags_condition
+from .models import User, Question, Answer, Tag
+
+bp = Blueprint('feeds', __name__)
+
+# Rendered feeds, one cache per worker: scope -> (version, body)
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def feed_response(scope: str, version: datetime | None, build):
+    # Feed changes only when something changes in its scope, so time
+    # of the last change is its version. Polling clients that already
+    # have this version get 304 response, the others get body rendered
+    # once per version. ETag is weak, because body is sent compressed
+    # or not, depending on the client
+    version = version or datetime(1970, 1, 1)
+    etag = hashlib.blake2b(f'{scope}:{version.isoformat()}'.encode(),
+                           digest_size=16).hexdigest()
+
+    response = Response(mimetype='application/atom+xml')
+    response.set_etag(etag, weak=True)
+    response.last_modified = version
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['FEED_MAX_AGE']
+    # Last-Modified has whole seconds, so it is trusted only for
+    # versions without fractions, two changes within one second
+    # would look the same. ETag is compared first
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = bool(
+            request.if_modified_since and version.microsecond == 0 and
+            request.if_modified_since.replace(tzinfo=None) >= version)
+    if not_modified:
+        response.status_code = 304
+        return response
+
+    with _cache_lock:
+        cached = _cache.get(scope)
+        if cached is not None and cached[0] == version:
+            _cache.move_to_end(scope)
+            response.set_data(cached[1])
+            return response
+
+    body = build(version)
+    with _cache_lock:
+        _cache[scope] = (version, body)
+        _cache.move_to_end(scope)
+        while len(_cache) > current_app.config['FEED_CACHE_SIZE']:
+            _cache.popitem(last=False)
+    response.set_data(body)
+    return response
+
+
+def question_entry(question: Question) -> dict:
+    return {
+        'title': question.title,
+        'url': url_for('main.question_detail', id=question.id,
+                       _external=True),
+        'published': question.asked,
+        'updated': question.updated or question.asked,
+        'author': question.user.username,
+        'content': question.details_html or question.details,
+    }
+
+
+@bp.route('/tags/<tag>/feed')
+def tag_feed(tag):
+    included, excluded = parse_tags_path(tag)
+    if not included:
+        abort(404)
+    condition = tags_condition(included, excluded)
+
+    # Every question in the feed has all included tags, so they are
+    # marked when any of its questions is posted, changed or removed
+    version = db.session.query(db.func.max(Tag.changed)).\
+        filter(Tag.name.in_(included)).scalar()
+
+    def build(updated):
+        questions = db.session.query(Question).\
+            options(db.joinedload(Question.user)).\
+            filter(condition).\
+            order_by(Question.asked.desc()).\
+            limit(current_app.config['FEED_ENTRIES']).all()
+        return render_template(
+            'feeds/atom.xml',
+            title=f'Asklee: questions tagged {", ".join(included)}',
+            feed_url=request.base_url,
+            page_url=url_for('main.questions_by_tag', tag=tag, _external=True),
+            updated=updated,
+            entries=[question_entry(question) for question in questions])
+
+    return feed_response(f'tag:{"+".join(included)}+!{"+".join(excluded)}',
+                         version, build)
+
+
+@bp.route('/users/<username>/feed')
+def user_feed(username):
+    user = db.session.query(User).\
+        filter_by(username=username).first()
+    if not user:
+        abort(404)
+
+    # Marked when questions or answers of the user are posted,
+    # changed or removed, see 'touch_users'
+    version = user.changed
+
+    def build(updated):
+        limit = current_app.config['FEED_ENTRIES']
+        questions = db.session.query(Question).\
+            options(db.joinedload(Question.user)).\
+            filter_by(user_id=user.id).\
+            order_by(Question.asked.desc()).limit(limit).all()
+        answers = db.session.query(Answer).\
+            options(db.joinedload(Answer.question)).\
+            filter_by(user_id=user.id).\
+            order_by(Answer.published.desc()).limit(limit).all()
+
+        entries = [question_entry(question) for question in questions]
+        for answer in answers:
+            entries.append({
+                'title': f'Answer to: {answer.question.title}',
+                'url': url_for('main.question_detail', id=answer.question_id,
+                               _external=True) + f'#answer-{answer.id}',
+                'published': answer.published,
+                'updated': answer.updated or answer.published,
+                'author': user.username,
+                'content': answer.content_html or answer.content,
+            })
+        entries.sort(key=lambda entry: entry['published'], reverse=True)
+
+        return render_template(
+            'feeds/atom.xml',
+            title=f'Asklee: questions and answers of {user.username}',
+            feed_url=request.base_url,
+            page_url=url_for('main.public_page', username=user.username,
+                             _external=True),
+            updated=updated,
+            entries=entries[:limit])
+
+    return feed_response(f'user:{user.id}', version, build)
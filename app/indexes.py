@@ -0,0 +1,65 @@
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundIndex:
+    # Base of in-memory indexes that are rebuilt from the database in a
+    # background thread of the worker. Requests only start the rebuild
+    # when index is missing or stale and keep using the previous copy
+    # (or nothing, until the first copy is built), so they never wait
+    # for it. At most one rebuild of the index runs at a time.
+    # Subclasses implement 'rebuild', which builds new structures and
+    # swaps them in under their own lock
+
+    def __init__(self):
+        self.rebuild_interval = 600
+        self.in_background = True
+        self._app = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        # Time the last rebuild was started, failed rebuild
+        # is retried only after the interval too
+        self._started_at = None
+        self._built_at = None
+
+    def init_app(self, app):
+        self._app = app
+        self.in_background = app.config.get('INDEXES_REBUILD_IN_BACKGROUND',
+                                            self.in_background)
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def refresh(self):
+        # Starts rebuild in background thread if index is not built
+        # or is stale and no rebuild is running in this worker
+        started_at = self._started_at
+        if started_at is not None and \
+                time.monotonic() - started_at <= self.rebuild_interval:
+            return
+        if not self.in_background:
+            # Rebuild in the request, with its session
+            self._started_at = time.monotonic()
+            self.rebuild()
+            return
+        with self._thread_lock:
+            # Thread started before gunicorn forked the worker
+            # is not alive in the worker
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._started_at = time.monotonic()
+            self._thread = threading.Thread(
+                target=self._rebuild_in_background, daemon=True,
+                name=f'{type(self).__name__}.rebuild')
+            self._thread.start()
+
+    def _rebuild_in_background(self):
+        try:
+            with self._app.app_context():
+                self.rebuild()
+        except Exception:
+            logger.exception('Rebuild of %s failed.', type(self).__name__)
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from flask import Response, current_app, g, request
+
+from .metrics import SHED_REQUESTS, metrics_endpoint_name
+
+
+class InFlightCounter:
+    # Number of requests the worker is handling right now, more than
+    # one only with threaded workers
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def increment(self) -> int:
+        with self._lock:
+            self.value += 1
+            return self.value
+
+    def decrement(self):
+        with self._lock:
+            self.value -= 1
+
+
+in_flight = InFlightCounter()
+
+
+def parse_request_start(value: str) -> float | None:
+    # Proxies send time when they received request as 't=<time>' or
+    # just '<time>', in seconds (nginx '${msec}'), milliseconds
+    # (Heroku) or microseconds (Apache '%t'). Returns seconds
+    value = value.strip()
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        started = float(value)
+    except ValueError:
+        return None
+    if started > 1e14:
+        return started / 1e6
+    if started > 1e11:
+        return started / 1e3
+    return started
+
+
+def queue_time() -> float:
+    header = request.headers.get(current_app.config['LOAD_SHEDDING_HEADER'])
+    if not header:
+        return 0.0
+    started = parse_request_start(header)
+    if started is None:
+        return 0.0
+    # Clocks of proxy and worker may differ a little
+    return max(0.0, time.time() - started)
+
+
+def shed(reason: str) -> Response:
+    # Response is built without templates or database,
+    # so rejecting request costs almost nothing
+    SHED_REQUESTS.labels(metrics_endpoint_name(), reason).inc()
+    response = Response('Service is overloaded, try again later.\n',
+                        status=503, mimetype='text/plain')
+    response.headers['Retry-After'] = \
+        str(current_app.config['LOAD_SHEDDING_RETRY_AFTER'])
+    return response
+
+
+def check_load():
+    priority = current_app.config['LOAD_SHEDDING_PRIORITIES'].get(
+        request.endpoint, 'normal')
+    limits = current_app.config['LOAD_SHEDDING_LIMITS'][priority]
+
+    # Request that waited too long would most likely be
+    # abandoned by client before it is handled
+    if queue_time() > limits['queue_time']:
+        return shed('queue_time')
+
+    g.load_shedding_in_flight = True
+    if in_flight.increment() > limits['in_flight']:
+        return shed('in_flight')
+
+
+def finish_request(exception):
+    if g.pop('load_shedding_in_flight', False):
+        in_flight.decrement()
+
+
+def init_app(app):
+    if not app.config['LOAD_SHEDDING_ENABLED']:
+        return
+
+    # Has to be registered before other hooks, so that
+    # rejected request does not run them
+    app.before_request(check_load)
+    app.teardown_request(finish_request)
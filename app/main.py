@@ -1,11 +1,36 @@
+import re
+from collections import namedtuple
 from datetime import datetime
-from flask import Blueprint, render_template, redirect, url_for, request, flash, abort
+from flask import Blueprint, render_template, redirect, url_for, request, flash, abort, jsonify, current_app
+from flask import Response, stream_with_context
 from flask_login import login_required, current_user
-from .models import User, Question, Tag, QuestionViews, Answer, QuestionVote, AnswerVote, tagged_items
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy.exc import IntegrityError
+from .models import User, Question, Tag, Answer, QuestionVote, AnswerVote, tagged_items
 from . import db
+from .duplicates import duplicate_detector
+from .related import related_questions
+from .rendering import render_markdown
+from .reputation import (change_reputation, question_vote_points,
+                         answer_vote_points, revoke_question_reputation,
+                         answers_reputation)
+from .search_cache import search_cache, normalize_query
+from .shared_cache import shared_cache
+from .view_counter import view_counter
+from .tag_suggestions import tag_suggestions, normalize_tag
+from .tag_synonyms import tag_synonyms
 
 bp = Blueprint('main', __name__)
 
+# Ways answers on question's page can be sorted
+ANSWERS_ORDER = ('score', 'newest', 'oldest')
+
+# Tags in '/tags/<tag>/' are separated with '+', but not with '+'
+# that is part of tag's name, like in 'c++'
+TAGS_SEPARATOR = re.compile(r'(?<!\+)\+(?=[^+])')
+# Tag filters in search text: '[python]' or '[!django]'
+SEARCH_TAG_FILTER = re.compile(r'\[\s*(!?)([^\[\]]+?)\s*\]')
+
 
 def split_tags_string(tags_str: str) -> list[str]:
     # Takes a string of tags as an argument
@@ -22,92 +47,315 @@ def split_tags_string(tags_str: str) -> list[str]:
         elif not tag:
             pass
         else:
-            tags_to_return.append(tag.strip().lower())
-
-    for index, tag in enumerate(tags_to_return):
-        tags_to_return[index] = '-'.join(tag.split(' '))
+            tags_to_return.append(normalize_tag(tag))
 
     return tags_to_return
 
 
+def get_or_create_tags(tags: list[str]) -> list[Tag]:
+    # Takes list of tags returned by 'split_tags_string'
+    # and returns list of Tag objects, tags that do not
+    # exist yet are created and added to the session.
+    # Aliases are replaced with their canonical tags
+    tag_objects = []
+    for tag in tag_synonyms.resolve(tags):
+        existing_tag = db.session.query(Tag).\
+            filter_by(name=tag).first()
+        if existing_tag:
+            tag_objects.append(existing_tag)
+        else:
+            new_tag = Tag(name=tag)
+            tag_objects.append(new_tag)
+            db.session.add(new_tag)
+    return tag_objects
+
+
+def touch_tags(tags):
+    # Marks tags whose questions were posted, updated, deleted or
+    # retagged, time of the change is version of feeds of the tags
+    now = datetime.utcnow()
+    for tag in tags:
+        tag.changed = now
+
+
+def touch_users(user_ids):
+    # Marks users whose questions or answers were posted, updated or
+    # deleted, time of the change is version of feeds of the users.
+    # Rows are updated in order of ids, so that requests do not deadlock
+    now = datetime.utcnow()
+    for user_id in sorted(set(user_ids)):
+        db.session.execute(db.update(User).where(User.id == user_id).
+                           values(changed=now))
+
+
+def answer_authors(question_id: int) -> list[int]:
+    # Feeds of authors of answers show title of the question
+    return db.session.execute(
+        db.select(Answer.user_id).filter(Answer.question_id == question_id).
+        distinct()).scalars().all()
+
+
+def parse_tags_path(tags: str) -> tuple[list[str], list[str]]:
+    # Takes tags part of '/tags/<tag>/' url and returns lists of
+    # tags questions must have and must not have, for example
+    # 'python+flask+!django' is turned in
+    # (['python', 'flask'], ['django'])
+    included = []
+    excluded = []
+    for tag in TAGS_SEPARATOR.split(tags):
+        if tag.startswith('!'):
+            tag = tag_synonyms.canonical(normalize_tag(tag[1:]))
+            if tag and tag not in excluded:
+                excluded.append(tag)
+        else:
+            tag = tag_synonyms.canonical(normalize_tag(tag))
+            if tag and tag not in included:
+                included.append(tag)
+    return included, excluded
+
+
+def parse_search_query(query: str) -> tuple[str, list[str], list[str]]:
+    # Takes search text and returns it without tag filters,
+    # and lists of tags questions must have and must not have
+    included = []
+    excluded = []
+    for negation, tag in SEARCH_TAG_FILTER.findall(query):
+        tag = tag_synonyms.canonical(normalize_tag(tag))
+        tags = excluded if negation else included
+        if tag and tag not in tags:
+            tags.append(tag)
+    text = ' '.join(SEARCH_TAG_FILTER.sub(' ', query).split())
+    return text, included, excluded
+
+
+def tags_condition(included: list[str], excluded: list[str]):
+    # Returns condition on Question.id that selects questions which
+    # have all 'included' tags and none of 'excluded' tags.
+    # Everything is checked by the database with one GROUP BY over
+    # 'tagged_items' rows of the mentioned tags only
+    if not included:
+        return Question.id.notin_(
+            db.select(tagged_items.c.question_id).
+            join(Tag, Tag.id == tagged_items.c.tag_id).
+            filter(Tag.name.in_(excluded)))
+
+    matching = db.select(tagged_items.c.question_id).\
+        join(Tag, Tag.id == tagged_items.c.tag_id).\
+        filter(Tag.name.in_(included + excluded)).\
+        group_by(tagged_items.c.question_id).\
+        having(db.func.count(db.distinct(db.case(
+            (Tag.name.in_(included), Tag.id)))) == len(included))
+    if excluded:
+        matching = matching.having(db.func.count(db.case(
+            (Tag.name.in_(excluded), 1))) == 0)
+    return Question.id.in_(matching)
+
+
+class UserRow:
+    # Author of question in listings, printed as
+    # username like User object
+    __slots__ = ('id', 'username', 'reputation')
+
+    def __init__(self, id: int, username: str, reputation: int):
+        self.id = id
+        self.username = username
+        self.reputation = reputation
+
+    def __str__(self):
+        return self.username
+
+
+class QuestionRow:
+    # Question in listings: only columns that listings show, without
+    # 'details' and other large columns, and without ORM state
+    __slots__ = ('id', 'title', 'asked', 'views', 'answer_count',
+                 'user', 'tags', 'votes')
+
+    def __init__(self, id: int, title: str, asked: datetime, views: int,
+                 answer_count: int, user: UserRow):
+        self.id = id
+        self.title = title
+        self.asked = asked
+        self.views = views
+        self.answer_count = answer_count
+        self.user = user
+        self.tags = []
+        self.votes = 0
+
+
+TagRow = namedtuple('TagRow', ['id', 'name'])
+TagCountRow = namedtuple('TagCountRow', ['name', 'questions_count'])
+
+# Tags of the home page are kept in cache shared by workers,
+# in as many slots as they take, and dropped from it when
+# questions are changed
+INDEX_TAGS_KEY = 'index:tags'
+
+
+def select_question_rows():
+    # Returns SELECT of columns 'load_question_rows' needs,
+    # filter and order it as needed
+    return db.select(Question.id, Question.title, Question.asked,
+                     Question.views, Question.answer_count,
+                     User.id, User.username, User.reputation).\
+        join(User, User.id == Question.user_id)
+
+
+def make_question_rows(rows) -> list[QuestionRow]:
+    # Takes rows selected by 'select_question_rows' and returns
+    # QuestionRow objects, tags and numbers of votes of all
+    # questions are selected with one query each
+    questions = {}
+    for (question_id, title, asked, views, answer_count,
+         user_id, username, reputation) in rows:
+        questions[question_id] = QuestionRow(
+            question_id, title, asked, views, answer_count,
+            UserRow(user_id, username, reputation))
+    if not questions:
+        return []
+
+    for question_id, tag_id, name in db.session.execute(
+            db.select(tagged_items.c.question_id, Tag.id, Tag.name).
+            join(Tag, Tag.id == tagged_items.c.tag_id).
+            filter(tagged_items.c.question_id.in_(questions)).
+            order_by(Tag.id)):
+        questions[question_id].tags.append(TagRow(tag_id, name))
+    for question_id, votes in db.session.execute(
+            db.select(QuestionVote.question_id,
+                      db.func.count(QuestionVote.id)).
+            filter(QuestionVote.question_id.in_(questions)).
+            group_by(QuestionVote.question_id)):
+        questions[question_id].votes = votes
+    return list(questions.values())
+
+
+def load_question_rows(statement) -> list[QuestionRow]:
+    return make_question_rows(db.session.execute(statement))
+
+
+def stream_question_rows(statement, batch_size: int):
+    # Yields QuestionRow objects read from server-side cursor in batches
+    # of 'batch_size', tags and votes are selected for every batch
+    result = db.session.execute(
+        statement.execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        yield from make_question_rows(rows)
+
+
+def stream_search_rows(question_ids: list[int], batch_size: int):
+    # Yields QuestionRow objects in order of 'question_ids',
+    # selecting them in batches of 'batch_size'
+    for start in range(0, len(question_ids), batch_size):
+        batch = question_ids[start:start + batch_size]
+        questions = {question.id: question for question in
+                     load_question_rows(select_question_rows().
+                                        filter(Question.id.in_(batch)))}
+        # Questions deleted after results were cached are skipped
+        yield from (questions[question_id] for question_id in batch
+                    if question_id in questions)
+
+
+def render_listing(template_name: str, questions, count, **context):
+    # Renders listing page with 'questions' generator of QuestionRow
+    # objects. Normally rows are read first and page is rendered at
+    # once. With LISTINGS_STREAMING beginning of page is sent right
+    # away and rows are rendered as they are read from the database,
+    # so time to first byte and memory do not grow with number of
+    # rows. Number of questions is then taken from 'count' callable
+    if not current_app.config['LISTINGS_STREAMING']:
+        questions = list(questions)
+        return render_template(template_name, questions=questions,
+                               questions_count=len(questions), **context)
+
+    app = current_app._get_current_object()
+    context.update(questions=questions, questions_count=count())
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    # Template is sent in parts of several pieces, not piece by piece
+    stream.enable_buffering(app.config['LISTINGS_STREAM_BUFFER'])
+    return Response(stream_with_context(stream), mimetype='text/html')
+
+
+def select_questions_answered(user_id: int):
+    # Questions the user answered, in order of their first answers
+    return db.select(Question.id, Question.title).\
+        join(Answer, Answer.question_id == Question.id).\
+        filter(Answer.user_id == user_id).\
+        group_by(Question.id, Question.title).\
+        order_by(db.func.min(Answer.id))
+
+
+def cast_vote(vote_model, target_column, target_id: int, user_id: int,
+              is_upvote: bool, author_id: int, vote_points):
+    # Voting the same way again takes vote back, voting the other way
+    # changes it. Vote is inserted, deleted or changed by statement
+    # that only matches vote as it was read, and reputation is changed
+    # only when statement matched it, so that two requests of the same
+    # user voting at once (from two tabs) do not both change reputation
+    # of the author, the one that lost the race changes nothing
+    condition = (vote_model.user_id == user_id) & (target_column == target_id)
+    old_vote = db.session.execute(
+        db.select(vote_model.is_upvote).filter(condition)).scalar()
+
+    if old_vote is None:
+        try:
+            db.session.execute(db.insert(vote_model).values(
+                {target_column.key: target_id, 'user_id': user_id,
+                 'is_upvote': is_upvote}))
+        except IntegrityError:
+            # Another request of the user has just voted
+            db.session.rollback()
+            return None
+        change = vote_points(is_upvote)
+    else:
+        if old_vote == is_upvote:
+            statement = db.delete(vote_model).\
+                where(condition, vote_model.is_upvote == old_vote)
+            change = -vote_points(old_vote)
+        else:
+            statement = db.update(vote_model).\
+                where(condition, vote_model.is_upvote == old_vote).\
+                values(is_upvote=is_upvote)
+            change = vote_points(is_upvote) - vote_points(old_vote)
+        if db.session.execute(statement).rowcount != 1:
+            # Another request of the user has just changed the vote
+            db.session.rollback()
+            return None
+
+    change_reputation(author_id, change)
+    db.session.commit()
+    return None
+
+
 def upvote_downvote_question(question_id: int, user_id: int, is_upvote: bool):
     # pass to this function only existing questions
     # and authenticated users
-    existing_vote = db.session.query(QuestionVote).\
-        filter((QuestionVote.user_id == user_id) &
-               (QuestionVote.question_id == question_id)).first()
-    if not existing_vote:
-        vote = QuestionVote(user_id=user_id,
-                            question_id=question_id,
-                            is_upvote=is_upvote)
-        db.session.add(vote)
-        db.session.commit()
-        return None
-
-    if existing_vote:
-        if existing_vote.is_upvote == True:
-            if is_upvote == True:
-                db.session.delete(existing_vote)
-                db.session.commit()
-                return None
-            elif is_upvote == False:
-                existing_vote.is_upvote = False
-                db.session.commit()
-                return None
-        elif existing_vote.is_upvote == False:
-            if is_upvote == False:
-                db.session.delete(existing_vote)
-                db.session.commit()
-                return None
-            elif is_upvote == True:
-                existing_vote.is_upvote = True
-                db.session.commit()
-                return None
+    author_id = db.session.query(Question.user_id).\
+        filter_by(id=question_id).scalar()
+    return cast_vote(QuestionVote, QuestionVote.question_id, question_id,
+                     user_id, is_upvote, author_id, question_vote_points)
 
 
 def upvote_downvote_answer(answer_id: int, user_id: int, is_upvote: bool):
-    existing_vote = db.session.query(AnswerVote).\
-        filter((AnswerVote.answer_id == answer_id) &
-               (AnswerVote.user_id == user_id)).first()
-
-    if not existing_vote:
-        vote = AnswerVote(
-            answer_id=answer_id,
-            user_id=user_id,
-            is_upvote=is_upvote
-        )
-        db.session.add(vote)
-        db.session.commit()
-        return None
-
-    if existing_vote:
-        if existing_vote.is_upvote == True:
-            if is_upvote == True:
-                db.session.delete(existing_vote)
-                db.session.commit()
-                return None
-            if is_upvote == False:
-                existing_vote.is_upvote = False
-                db.session.commit()
-                return None
-        if existing_vote.is_upvote == False:
-            if is_upvote == False:
-                db.session.delete(existing_vote)
-                db.session.commit()
-                return None
-            if is_upvote == True:
-                existing_vote.is_upvote = True
-                db.session.commit()
-                return None
+    author_id = db.session.query(Answer.user_id).\
+        filter_by(id=answer_id).scalar()
+    return cast_vote(AnswerVote, AnswerVote.answer_id, answer_id,
+                     user_id, is_upvote, author_id, answer_vote_points)
+
+
+def select_index_tags() -> list[list]:
+    # Names of tags that have questions, with number of them
+    return [list(row) for row in db.session.execute(
+        db.select(Tag.name, db.func.count(tagged_items.c.question_id)).
+        join(tagged_items, tagged_items.c.tag_id == Tag.id).
+        group_by(Tag.id, Tag.name).order_by(Tag.id))]
 
 
 @bp.route('/')
 def index():
-    tags = []
-    for tag in db.session.query(Tag).\
-            options(db.joinedload(Tag.questions)).all():
-        if len(tag.questions) >= 1:
-            tags.append(tag)
+    tags = [TagCountRow(*row) for row in
+            shared_cache.get_or_set_list(INDEX_TAGS_KEY,
+                                         select_index_tags)]
     return render_template('main/index.html', tags=tags)
 
 
@@ -141,22 +389,23 @@ def post_question():
 
         question = Question(title=title,
                             details=details if details else None,
+                            details_html=render_markdown(details),
                             user_id=current_user.id)
         db.session.add(question)
 
         if tags.strip():
-            tags = split_tags_string(tags)
-            for tag in tags:
-                existing_tag = db.session.execute(
-                    db.select(Tag).filter_by(name=tag)).scalar_one_or_none()
-                if existing_tag:
-                    question.tags.append(existing_tag)
-                else:
-                    new_tag = Tag(name=tag)
-                    question.tags.append(new_tag)
-                    db.session.add(new_tag)
+            question.tags.extend(get_or_create_tags(split_tags_string(tags)))
+        touch_tags(question.tags)
+        touch_users([current_user.id])
 
         db.session.commit()
+        search_cache.bump_generation()
+        shared_cache.delete(INDEX_TAGS_KEY)
+        tag_suggestions.add([tag.name for tag in question.tags])
+        related_questions.update(question.id, question.title,
+                                 [tag.id for tag in question.tags])
+        duplicate_detector.update(question.id, question.title,
+                                  question.details)
 
         flash('You successfully asked new question!', 'success')
         return redirect(url_for('main.index'))
@@ -164,6 +413,22 @@ def post_question():
     return render_template('main/post_question.html')
 
 
+@bp.route('/questions/similar/', methods=['GET'])
+def similar_questions():
+    # Suggests existing questions similar to the one that
+    # is being written, before it is posted
+    title = request.args.get('title', '')
+    details = request.args.get('details')
+    exclude = request.args.get('exclude', type=int)
+    questions = duplicate_detector.similar(title, details, exclude=exclude)
+    return jsonify(questions=[
+        {'id': question_id, 'title': question_title,
+         'url': url_for('main.question_detail', id=question_id),
+         'similarity': similarity}
+        for question_id, question_title, similarity in questions
+    ])
+
+
 @bp.route('/questions/<int:id>/update/', methods=['GET', 'POST'])
 @login_required
 def update_question(id):
@@ -216,20 +481,13 @@ def update_question(id):
 
         question.title = title
         question.details = details
+        question.details_html = render_markdown(details)
         question.updated = datetime.utcnow()
+        old_tag_objects = list(question.tags)
+        old_tags = [tag.name for tag in old_tag_objects]
 
         if tags.strip():
-            tags = split_tags_string(tags)
-            tag_objects = []
-            for tag in tags:
-                existing_tag = db.session.query(Tag).\
-                    filter_by(name=tag).first()
-                if existing_tag:
-                    tag_objects.append(existing_tag)
-                else:
-                    new_tag = Tag(name=tag)
-                    tag_objects.append(new_tag)
-                    db.session.add(new_tag)
+            tag_objects = get_or_create_tags(split_tags_string(tags))
 
             question.tags.clear()
             for tag_object in tag_objects:
@@ -256,7 +514,17 @@ def update_question(id):
         #             question.tags.append(new_tag)
         #             db.session.add(new_tag)
 
+        touch_tags(set(old_tag_objects) | set(question.tags))
+        touch_users([question.user_id, *answer_authors(question.id)])
         db.session.commit()
+        search_cache.bump_generation()
+        shared_cache.delete(INDEX_TAGS_KEY)
+        related_questions.update(question.id, question.title,
+                                 [tag.id for tag in question.tags])
+        duplicate_detector.update(question.id, question.title,
+                                  question.details)
+        tag_suggestions.discard(old_tags)
+        tag_suggestions.add([tag.name for tag in question.tags])
         flash('You successfully updated your question.', 'success')
         return redirect(url_for('main.question_detail', id=question.id))
 
@@ -265,7 +533,7 @@ def update_question(id):
 def question_detail(id):
 
     question = db.session.query(Question).\
-        options(db.joinedload(Question.times_viewed), db.joinedload(Question.user),
+        options(db.joinedload(Question.user),
                 db.joinedload(Question.tags)).\
         filter_by(id=id).first()
 
@@ -282,70 +550,124 @@ def question_detail(id):
         (QuestionVote.is_upvote == False)
     ).count()
 
+    # Anonymous visitors are told apart by address and browser, not by
+    # id in session, so that viewing a question does not set a cookie.
+    # Address is the one of client, not of proxy, see PROXY_FIX_HOPS
     if current_user.is_authenticated:
-        question_views_obj = QuestionViews.query.filter(
-            (QuestionViews.user_id == current_user.id)
-            & (QuestionViews.question_id == question.id)
-        ).first()
-        if not question_views_obj:
-            question_views_obj = QuestionViews(
-                user_id=current_user.id,
-                question_id=question.id
-            )
-            db.session.add(question_views_obj)
-            db.session.commit()
-
-        voting_status = db.session.query(QuestionVote).filter(
-            (QuestionVote.question_id == question.id) &
-            (QuestionVote.user_id == current_user.id)
-        ).first()
-
+        visitor = f'user:{current_user.id}'
     else:
-        voting_status = None
-
-    answers = db.session.query(Answer).options(
-        db.joinedload(Answer.user)
-    ).filter_by(question_id=question.id).all()
-
+        visitor = 'visitor:{}:{}'.format(
+            request.remote_addr, request.headers.get('User-Agent', ''))
+    view_counter.record(question.id, visitor)
+
+    sort = request.args.get('sort', 'score')
+    if sort not in ANSWERS_ORDER:
+        sort = 'score'
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['ANSWERS_PER_PAGE']
+
+    answers_total = db.session.query(db.func.count(Answer.id)).\
+        filter_by(question_id=question.id).scalar()
+    pages = max(1, -(-answers_total // per_page))
+    page = min(max(page, 1), pages)
+
+    # Votes of answers are counted in the database in the same query
+    # that selects the page of answers, so that answers can be sorted
+    # by score there
+    answer_votes = db.session.query(
+        AnswerVote.answer_id,
+        db.func.count(db.case((AnswerVote.is_upvote == True, 1))).
+        label('upvotes'),
+        db.func.count(db.case((AnswerVote.is_upvote == False, 1))).
+        label('downvotes')
+    ).join(Answer, Answer.id == AnswerVote.answer_id).\
+        filter(Answer.question_id == question.id).\
+        group_by(AnswerVote.answer_id).subquery()
+    upvotes_column = db.func.coalesce(answer_votes.c.upvotes, 0)
+    downvotes_column = db.func.coalesce(answer_votes.c.downvotes, 0)
+    order_by = {
+        'score': ((upvotes_column - downvotes_column).desc(),
+                  Answer.published.desc()),
+        'newest': (Answer.published.desc(),),
+        'oldest': (Answer.published.asc(),),
+    }[sort]
+
+    rows = db.session.query(Answer, upvotes_column, downvotes_column).\
+        options(db.joinedload(Answer.user)).\
+        outerjoin(answer_votes, answer_votes.c.answer_id == Answer.id).\
+        filter(Answer.question_id == question.id).\
+        order_by(*order_by, Answer.id).\
+        limit(per_page).offset((page - 1) * per_page).all()
+
+    related = related_questions.get(question.id)
+
+    answers = []
     answers_upvotes = {}
     answers_downvotes = {}
-    for answer in answers:
-        answers_upvotes[answer.id] = db.session.query(AnswerVote).filter(
-            (AnswerVote.answer_id == answer.id) &
-            (AnswerVote.is_upvote == True)
-        ).count()
-        answers_downvotes[answer.id] = db.session.query(AnswerVote).filter(
-            (AnswerVote.answer_id == answer.id) &
-            (AnswerVote.is_upvote == False)
-        ).count()
-
-    if current_user.is_authenticated:
-        answer_votes_user = {}
-        for answer in answers:
-            user_vote = db.session.query(AnswerVote).filter(
-                (AnswerVote.answer_id == answer.id) &
-                (AnswerVote.user_id == current_user.id)
-            ).first()
-            if user_vote:
-                answer_votes_user[answer.id] = user_vote
-    else:
-        answer_votes_user = {}
+    for answer, answer_upvotes, answer_downvotes in rows:
+        answers.append(answer)
+        answers_upvotes[answer.id] = answer_upvotes
+        answers_downvotes[answer.id] = answer_downvotes
 
+    # Page is the same for every viewer, votes of viewer and
+    # controls of author are shown by browser, see 'viewer_votes'
     return render_template('main/question_detail.html', question=question,
-                           voting_status=voting_status, upvotes=upvotes,
+                           upvotes=upvotes,
                            downvotes=downvotes,
                            answers=answers,
+                           answers_total=answers_total,
+                           page=page, pages=pages, sort=sort,
                            answers_upvotes=answers_upvotes,
                            answers_downvotes=answers_downvotes,
-                           answer_votes_user=answer_votes_user)
+                           related=related)
+
+
+@bp.route('/questions/<int:id>/votes/', methods=['GET'])
+def viewer_votes(id):
+    # Votes of current user on question and on answers with ids
+    # in 'answers' argument (separated by commas), selected in one
+    # query, with id of user and CSRF token for forms of the page
+    answer_ids = [int(answer_id)
+                  for answer_id in request.args.get('answers', '').split(',')
+                  if answer_id.isascii() and answer_id.isdecimal()]
+    answer_ids = answer_ids[:current_app.config['ANSWERS_PER_PAGE']]
+
+    question_vote = None
+    answer_votes = {}
+    if current_user.is_authenticated:
+        votes = db.session.execute(db.union_all(
+            db.select(db.literal('question'), QuestionVote.question_id,
+                      QuestionVote.is_upvote).
+            filter(QuestionVote.user_id == current_user.id,
+                   QuestionVote.question_id == id),
+            db.select(db.literal('answer'), AnswerVote.answer_id,
+                      AnswerVote.is_upvote).
+            filter(AnswerVote.user_id == current_user.id,
+                   AnswerVote.answer_id.in_(answer_ids)))).all()
+        for kind, voted_id, is_upvote in votes:
+            if kind == 'question':
+                question_vote = is_upvote
+            else:
+                answer_votes[voted_id] = is_upvote
+
+    response = jsonify(
+        user_id=current_user.id if current_user.is_authenticated else None,
+        csrf_token=generate_csrf()
+        if current_app.config['WTF_CSRF_ENABLED'] else None,
+        question=question_vote, answers=answer_votes)
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
 
 
 @bp.route('/questions/<int:id>/delete/', methods=['POST'])
 @login_required
 def delete_question(id):
     if request.method == 'POST':
+        # Row of question stays locked until it is deleted, so that
+        # votes cast meanwhile are not left out of revoked points and
+        # the same question deleted from two tabs is revoked once
         question = db.session.query(Question).\
-            filter_by(id=id).first()
+            filter_by(id=id).with_for_update().first()
 
         if not question:
             abort(404)
@@ -353,8 +675,18 @@ def delete_question(id):
         if question.user_id != current_user.id:
             abort(403)
 
+        question_id = question.id
+        question_tags = [tag.name for tag in question.tags]
+        revoke_question_reputation(question)
+        touch_tags(question.tags)
+        touch_users([question.user_id, *answer_authors(question.id)])
         db.session.delete(question)
         db.session.commit()
+        search_cache.bump_generation()
+        shared_cache.delete(INDEX_TAGS_KEY)
+        related_questions.remove(question_id)
+        duplicate_detector.remove(question_id)
+        tag_suggestions.discard(question_tags)
 
         flash('You successfully deleted your question.', 'success')
         return redirect(url_for('main.index'))
@@ -394,34 +726,67 @@ def downvote_question(id):
         return redirect(url_for('main.question_detail', id=question.id))
 
 
-@bp.route('/tags/<tag>/', methods=['GET'])
-def questions_by_tag(tag):
-    tag_object = db.session.query(Tag).\
-        filter_by(name=tag).first()
+@bp.route('/tags/suggest', methods=['GET'])
+def suggest_tags():
+    prefix = request.args.get('prefix', '')
+    return jsonify(tags=tag_synonyms.resolve(tag_suggestions.suggest(prefix)))
 
-    if not tag_object:
-        return render_template('main/questions_by_tag.html', tag=tag, questions=[])
 
-    questions = db.session.query(Question).\
+@bp.route('/tags/<tag>/', methods=['GET'])
+def questions_by_tag(tag):
+    included, excluded = parse_tags_path(tag)
+
+    if not included:
+        return render_template('main/questions_by_tag.html', tag=tag,
+                               included=included, excluded=excluded,
+                               questions=[], questions_count=0)
+
+    condition = tags_condition(included, excluded)
+    questions = stream_question_rows(
+        select_question_rows().
+        filter(condition).
+        order_by(Question.asked.desc()),
+        current_app.config['LISTINGS_BATCH_SIZE'])
+
+    def count():
+        return db.session.execute(
+            db.select(db.func.count(Question.id)).filter(condition)).scalar()
+
+    return render_listing('main/questions_by_tag.html', questions, count,
+                          tag=tag, included=included, excluded=excluded)
+
+
+@bp.route('/questions/unanswered/', methods=['GET'])
+def unanswered_questions():
+    tag = tag_synonyms.canonical(normalize_tag(request.args.get('tag', '')))
+    before = request.args.get('before', type=int)
+    per_page = current_app.config['UNANSWERED_PER_PAGE']
+
+    # Keyset pagination: next page starts after the last shown id,
+    # so every page is read from partial index of unanswered
+    # questions the same way, however far it is
+    query = db.session.query(Question).\
         options(db.joinedload(Question.tags),
-                db.joinedload(Question.user),
-                db.joinedload(Question.times_viewed)).\
-        filter(Question.tags.contains(tag_object)).\
-        order_by(Question.asked.desc()).\
-        all()
-
-    answers_count = {}
-    votes_count = {}
-    for question in questions:
-        answers_count[question.id] = db.session.query(Answer). \
-            filter_by(question_id=question.id).count()
-        votes_count[question.id] = db.session.query(QuestionVote).\
-            filter_by(question_id=question.id).count()
-
-    return render_template('main/questions_by_tag.html', tag=tag,
+                db.joinedload(Question.user)).\
+        filter(Question.answer_count == 0)
+    if tag:
+        query = query.filter(Question.id.in_(
+            db.select(tagged_items.c.question_id).
+            join(Tag, Tag.id == tagged_items.c.tag_id).
+            filter(Tag.name == tag)))
+    if before:
+        query = query.filter(Question.id < before)
+    questions = query.order_by(Question.id.desc()).limit(per_page + 1).all()
+
+    next_before = None
+    if len(questions) > per_page:
+        questions = questions[:per_page]
+        next_before = questions[-1].id
+
+    return render_template('main/unanswered.html',
                            questions=questions,
-                           answers_count=answers_count,
-                           votes_count=votes_count)
+                           tag=tag,
+                           next_before=next_before)
 
 
 @bp.route('/questions/<int:question_id>/answer/', methods=['POST', 'GET'])
@@ -455,10 +820,19 @@ def post_answer(question_id):
                                    question=question)
 
         answer = Answer(content=content,
+                        content_html=render_markdown(content),
                         user_id=current_user.id,
                         question_id=question.id)
 
+        # Question deleted since it was read is not answered
+        updated = db.session.execute(
+            db.update(Question).where(Question.id == question.id).
+            values(answer_count=Question.answer_count + 1)).rowcount
+        if updated != 1:
+            db.session.rollback()
+            abort(404)
         db.session.add(answer)
+        touch_users([current_user.id])
         db.session.commit()
 
         flash('You successfully published your answer.', 'success')
@@ -502,7 +876,9 @@ def update_answer(id):
                                    question=answer.question)
 
         answer.content = content
+        answer.content_html = render_markdown(content)
         answer.updated = datetime.utcnow()
+        touch_users([answer.user_id])
 
         db.session.commit()
 
@@ -520,8 +896,10 @@ def update_answer(id):
 @login_required
 def delete_answer(id):
     if request.method == 'POST':
+        # Row of answer stays locked until it is deleted, so that
+        # votes cast meanwhile are not left out of revoked points
         answer = db.session.query(Answer).\
-            filter_by(id=id).first()
+            filter_by(id=id).with_for_update().first()
 
         if not answer:
             abort(404)
@@ -531,7 +909,23 @@ def delete_answer(id):
 
         question_id = answer.question_id
 
-        db.session.delete(answer)
+        # Points are read before answer is deleted, its votes are deleted
+        # together with it. When the same answer is deleted by two
+        # requests at once (from two tabs), only the one that deleted
+        # it revokes points and changes number of answers
+        points = answers_reputation(Answer.id == id)
+        deleted = db.session.execute(
+            db.delete(Answer).where(Answer.id == id)).rowcount
+        if deleted != 1:
+            db.session.rollback()
+            abort(404)
+
+        for user_id, user_points in points:
+            change_reputation(user_id, -user_points)
+        db.session.execute(
+            db.update(Question).where(Question.id == question_id).
+            values(answer_count=Question.answer_count - 1))
+        touch_users([answer.user_id])
         db.session.commit()
 
         flash('You successfully deleted your answer.', 'success')
@@ -576,26 +970,39 @@ def downvote_answer(id):
 @bp.route('/personal/page/')
 @login_required
 def personal_page():
-    questions_asked = db.session.query(Question).\
-        filter_by(user_id=current_user.id).all()
-
-    questions_answered = []
-
-    answers = db.session.query(Answer).\
-        options(db.joinedload(Answer.question)).\
-        filter_by(user_id=current_user.id).all()
+    questions_asked = db.session.execute(
+        db.select(Question.id, Question.title).
+        filter_by(user_id=current_user.id).order_by(Question.id)).all()
 
-    for answer in answers:
-        if answer.question in questions_answered:
-            continue
-        else:
-            questions_answered.append(answer.question)
+    questions_answered = db.session.execute(
+        select_questions_answered(current_user.id)).all()
 
     return render_template('main/personal_page.html',
                            questions_asked=questions_asked,
                            questions_answered=questions_answered)
 
 
+@bp.route('/users/', methods=['GET'])
+def leaderboard():
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['USERS_PER_PAGE']
+
+    users_total = db.session.query(db.func.count(User.id)).scalar()
+    pages = max(1, -(-users_total // per_page))
+    page = min(max(page, 1), pages)
+
+    # Users are read in order of index on reputation and id
+    users = db.session.query(User).\
+        order_by(User.reputation.desc(), User.id.desc()).\
+        limit(per_page).offset((page - 1) * per_page).all()
+
+    return render_template('main/leaderboard.html',
+                           users=users,
+                           first_place=(page - 1) * per_page + 1,
+                           page=page,
+                           pages=pages)
+
+
 @bp.route('/users/<username>/', methods=['GET'])
 def public_page(username):
     user = db.session.query(User).\
@@ -603,20 +1010,12 @@ def public_page(username):
     if not user:
         abort(404)
 
-    questions_asked = db.session.query(Question).\
-        filter_by(user_id=user.id).all()
+    questions_asked = db.session.execute(
+        db.select(Question.id, Question.title).
+        filter_by(user_id=user.id).order_by(Question.id)).all()
 
-    questions_answered = []
-
-    answers = db.session.query(Answer).\
-        options(db.joinedload(Answer.question)).\
-        filter_by(user_id=user.id).all()
-
-    for answer in answers:
-        if answer.question in questions_answered:
-            continue
-        else:
-            questions_answered.append(answer.question)
+    questions_answered = db.session.execute(
+        select_questions_answered(user.id)).all()
 
     return render_template('main/public_page.html',
                            user=user,
@@ -654,22 +1053,23 @@ def personal_post_question():
 
         question = Question(title=title,
                             details=details if details else None,
+                            details_html=render_markdown(details),
                             user_id=current_user.id)
         db.session.add(question)
 
         if tags:
-            tags = split_tags_string(tags)
-            for tag in tags:
-                existing_tag = db.session.execute(
-                    db.select(Tag).filter_by(name=tag)).scalar_one_or_none()
-                if existing_tag:
-                    question.tags.append(existing_tag)
-                else:
-                    new_tag = Tag(name=tag)
-                    question.tags.append(new_tag)
-                    db.session.add(new_tag)
+            question.tags.extend(get_or_create_tags(split_tags_string(tags)))
+        touch_tags(question.tags)
+        touch_users([current_user.id])
 
         db.session.commit()
+        search_cache.bump_generation()
+        shared_cache.delete(INDEX_TAGS_KEY)
+        tag_suggestions.add([tag.name for tag in question.tags])
+        related_questions.update(question.id, question.title,
+                                 [tag.id for tag in question.tags])
+        duplicate_detector.update(question.id, question.title,
+                                  question.details)
 
         flash('You successfully asked new question!', 'success')
         return redirect(url_for('main.personal_page'))
@@ -693,24 +1093,27 @@ def search():
     if query[0] == '#' or query[0] == '%':
         return redirect(url_for('main.questions_by_tag', tag=query[1:]))
 
-    questions = db.session.query(Question).\
-        options(db.joinedload(Question.user),
-                db.joinedload(Question.tags),
-                db.joinedload(Question.times_viewed)).\
-        filter((Question.title.contains(query)) |
-               (Question.details.contains(query))).\
-        order_by(Question.asked.desc()).all()
-
-    answers_count = {}
-    votes_count = {}
-    for question in questions:
-        answers_count[question.id] = db.session.query(Answer). \
-            filter_by(question_id=question.id).count()
-        votes_count[question.id] = db.session.query(QuestionVote).\
-            filter_by(question_id=question.id).count()
-
-    return render_template('main/search_results.html',
-                           questions=questions,
-                           answers_count=answers_count,
-                           votes_count=votes_count,
-                           query=query)
+    normalized_query = normalize_query(query)
+    # Generation is read before questions are selected, so results
+    # of a question changed meanwhile are stored as stale ones
+    generation = search_cache.current_generation()
+    question_ids = search_cache.get(normalized_query, generation)
+    if question_ids is None:
+        text, included, excluded = parse_search_query(normalized_query)
+        if not (text or included or excluded):
+            return render_template('main/empty_search.html')
+        select_ids = db.select(Question.id).order_by(Question.asked.desc())
+        if text:
+            select_ids = select_ids.filter(
+                (Question.title.icontains(text, autoescape=True)) |
+                (Question.details.icontains(text, autoescape=True)))
+        if included or excluded:
+            select_ids = select_ids.filter(tags_condition(included, excluded))
+        question_ids = db.session.execute(select_ids).scalars().all()
+        search_cache.set(normalized_query, question_ids, generation)
+
+    questions = stream_search_rows(question_ids,
+                                   current_app.config['LISTINGS_BATCH_SIZE'])
+
+    return render_listing('main/search_results.html', questions,
+                          lambda: len(question_ids), query=query)
@@ -0,0 +1,114 @@
+import os
+import time
+
+from flask import Response, g, has_request_context, request
+from flask import before_render_template, template_rendered
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry,
+                               Counter, Histogram, REGISTRY, generate_latest)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# When PROMETHEUS_MULTIPROC_DIR environment variable is set,
+# every gunicorn worker writes its values into its own memory-mapped
+# files in that directory, and '/metrics' sums files of all workers
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+REQUESTS = Counter('asklee_requests_total',
+                   'Number of handled requests.',
+                   ['endpoint', 'method', 'status'])
+REQUEST_TIME = Histogram('asklee_request_duration_seconds',
+                         'Total time spent handling request.',
+                         ['endpoint'], buckets=BUCKETS)
+DB_TIME = Histogram('asklee_request_db_duration_seconds',
+                    'Time spent executing SQL statements during request.',
+                    ['endpoint'], buckets=BUCKETS)
+TEMPLATE_TIME = Histogram('asklee_request_template_duration_seconds',
+                          'Time spent rendering templates during request.',
+                          ['endpoint'], buckets=BUCKETS)
+SHED_REQUESTS = Counter('asklee_shed_requests_total',
+                        'Number of requests rejected by load shedding.',
+                        ['endpoint', 'reason'])
+SHARED_CACHE_OVERSIZED = Counter(
+    'asklee_shared_cache_oversized_total',
+    'Number of values not cached because they do not fit in a slot.',
+    ['prefix'])
+
+
+def metrics_endpoint_name() -> str:
+    # Requests that did not match any route (404, 405)
+    # are counted together, so that scanning random urls
+    # does not create new label values
+    if request.url_rule is None:
+        return 'none'
+    return request.endpoint
+
+
+def start_request_timer():
+    g.metrics_start = time.perf_counter()
+    g.metrics_db_time = 0.0
+    g.metrics_template_time = 0.0
+
+
+def observe_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+
+    endpoint = metrics_endpoint_name()
+    REQUEST_TIME.labels(endpoint).observe(time.perf_counter() - start)
+    DB_TIME.labels(endpoint).observe(g.metrics_db_time)
+    TEMPLATE_TIME.labels(endpoint).observe(g.metrics_template_time)
+    REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    return response
+
+
+def before_cursor_execute(conn, cursor, statement, parameters,
+                          context, executemany):
+    conn.info['metrics_query_start'] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters,
+                         context, executemany):
+    start = conn.info.pop('metrics_query_start', None)
+    if start is not None and has_request_context() \
+            and 'metrics_db_time' in g:
+        g.metrics_db_time += time.perf_counter() - start
+
+
+def start_template_timer(app, template, context):
+    g.metrics_template_start = time.perf_counter()
+
+
+def stop_template_timer(app, template, context):
+    start = g.pop('metrics_template_start', None)
+    if start is not None and 'metrics_template_time' in g:
+        g.metrics_template_time += time.perf_counter() - start
+
+
+def metrics():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry),
+                    mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    app.before_request(start_request_timer)
+    app.after_request(observe_request)
+
+    if not event.contains(Engine, 'before_cursor_execute',
+                          before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    before_render_template.connect(start_template_timer, app)
+    template_rendered.connect(stop_template_timer, app)
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
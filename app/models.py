@@ -11,6 +11,16 @@ class User(UserMixin,  db.Model):
     username = db.Column(db.String(50), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
+    # Changed by votes for user's questions and answers when they are
+    # cast, changed or removed, see 'app/reputation.py'
+    reputation = db.Column(db.Integer, nullable=False, default=0,
+                           server_default='0')
+    # Time questions or answers of the user were last posted, updated
+    # or deleted, version of feed of the user, see 'app/feeds.py'
+    changed = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Leaderboard is read from this index
+    __table_args__ = (db.Index('ix_user_reputation_id', 'reputation', 'id'),)
 
     def __str__(self):
         return self.username
@@ -18,7 +28,10 @@ class User(UserMixin,  db.Model):
 
 class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(70))
+    name = db.Column(db.String(70), index=True)
+    # Time questions of the tag were last posted, updated, deleted or
+    # retagged, version of feed of the tag, see 'app/feeds.py'
+    changed = db.Column(db.DateTime, default=datetime.utcnow)
 
     # def __str__(self):
     #     return self.name
@@ -27,25 +40,62 @@ class Tag(db.Model):
     #     return self.name
 
 
+class TagSynonym(db.Model):
+    # Alias that is replaced with canonical tag everywhere
+    # tags are written or looked up, see 'app/tag_synonyms.py'
+    id = db.Column(db.Integer, primary_key=True)
+    alias = db.Column(db.String(70), unique=True, nullable=False)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'),
+                       nullable=False, index=True)
+    tag = db.relationship('Tag', backref=db.backref(
+        'synonyms', lazy=True, cascade="all, delete-orphan",
+        passive_deletes=True))
+
+
 tagged_items = db.Table('tagged_items',
                         db.Column('tag_id', db.Integer,
-                                  db.ForeignKey('tag.id')),
-                        db.Column('question_id', db.Integer, db.ForeignKey('question.id')))
+                                  db.ForeignKey('tag.id', ondelete='CASCADE')),
+                        db.Column('question_id', db.Integer,
+                                  db.ForeignKey('question.id', ondelete='CASCADE'),
+                                  index=True),
+                        # Questions with some tags are found
+                        # using only this index
+                        db.Index('ix_tagged_items_tag_id_question_id',
+                                 'tag_id', 'question_id'))
 
 
 class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(300))
     details = db.Column(db.Text, nullable=True)
+    # HTML rendered from Markdown in 'details'
+    details_html = db.Column(db.Text, nullable=True)
     asked = db.Column(db.DateTime, default=datetime.utcnow)
     # This field(updated) will be given value only when it is updated
     updated = db.Column(db.DateTime, nullable=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'),
-                        nullable=False)
+    # HyperLogLog sketch of viewers of the question
+    # and number of unique viewers estimated from it
+    # (sketch is not loaded with question unless asked for, it takes 4 KB)
+    views_sketch = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    views = db.Column(db.Integer, nullable=False, default=0,
+                      server_default='0')
+    # Kept up to date by 'post_answer' and 'delete_answer'
+    answer_count = db.Column(db.Integer, nullable=False, default=0,
+                             server_default='0')
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'),
+                        nullable=False, index=True)
     user = db.relationship('User', backref=db.backref(
-        'questions', lazy=True, cascade="all, delete-orphan"))
+        'questions', lazy=True, cascade="all, delete-orphan",
+        passive_deletes=True))
     tags = db.relationship('Tag', secondary=tagged_items,
-                           backref=db.backref('questions', lazy=True))
+                           backref=db.backref('questions', lazy=True),
+                           passive_deletes=True)
+
+    # Unanswered questions are read newest first from this index,
+    # which contains only them and so stays small
+    __table_args__ = (db.Index('ix_question_unanswered', 'id',
+                               postgresql_where=db.text('answer_count = 0'),
+                               sqlite_where=db.text('answer_count = 0')),)
 
     def __str__(self):
         return self.title
@@ -55,16 +105,18 @@ class Question(db.Model):
 
 
 class QuestionViews(db.Model):
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'),
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'),
                         primary_key=True)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'),
-                            primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'),
+                            primary_key=True, index=True)
     user = db.relationship(
         'User', backref=db.backref('views', lazy=True,
-                                   cascade="all, delete-orphan"))
+                                   cascade="all, delete-orphan",
+                                   passive_deletes=True))
     question = db.relationship(
         'Question', backref=db.backref('times_viewed', lazy=True,
-                                       cascade="all, delete-orphan"))
+                                       cascade="all, delete-orphan",
+                                       passive_deletes=True))
     __table_args__ = (UniqueConstraint('user_id', 'question_id',
                                        name='user_question_views_uc'),)
 
@@ -72,15 +124,20 @@ class QuestionViews(db.Model):
 class Answer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
+    # HTML rendered from Markdown in 'content'
+    content_html = db.Column(db.Text, nullable=True)
     published = db.Column(db.DateTime, default=datetime.utcnow)
     updated = db.Column(db.DateTime, nullable=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'),
-                            nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'),
+                        nullable=False, index=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
     question = db.relationship(
-        'Question', backref=db.backref('answers', lazy=True, cascade="all, delete-orphan"))
+        'Question', backref=db.backref('answers', lazy=True, cascade="all, delete-orphan",
+                                       passive_deletes=True))
     user = db.relationship('User', backref=db.backref(
-        'answers', lazy=True, cascade="all, delete-orphan"))
+        'answers', lazy=True, cascade="all, delete-orphan",
+        passive_deletes=True))
 
     def __repr__(self):
         return self.content
@@ -90,15 +147,18 @@ class QuestionVote(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     is_upvote = db.Column(db.Boolean, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'),
-                            nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'),
+                        nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
     question = db.relationship(
         'Question', backref=db.backref('votes', lazy=True,
-                                       cascade="all, delete-orphan"))
+                                       cascade="all, delete-orphan",
+                                       passive_deletes=True))
     user = db.relationship(
         'User', backref=db.backref('question_votes', lazy=True,
-                                   cascade="all, delete-orphan"))
+                                   cascade="all, delete-orphan",
+                                   passive_deletes=True))
     __table_args__ = (UniqueConstraint('user_id', 'question_id',
                                        name='user_question_vote_uc'),)
 
@@ -107,14 +167,17 @@ class AnswerVote(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     is_upvote = db.Column(db.Boolean, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    answer_id = db.Column(db.Integer, db.ForeignKey('answer.id'),
-                          nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'),
+                        nullable=False)
+    answer_id = db.Column(db.Integer, db.ForeignKey('answer.id', ondelete='CASCADE'),
+                          nullable=False, index=True)
     answer = db.relationship(
         'Answer', backref=db.backref('votes', lazy=True,
-                                     cascade="all, delete-orphan"))
+                                     cascade="all, delete-orphan",
+                                     passive_deletes=True))
     user = db.relationship(
         'User', backref=db.backref('answer_votes', lazy=True,
-                                   cascade="all, delete-orphan"))
+                                   cascade="all, delete-orphan",
+                                   passive_deletes=True))
     __table_args__ = (UniqueConstraint('user_id', 'answer_id',
                                        name='user_answer_vote_uc'),)
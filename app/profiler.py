@@ -0,0 +1,94 @@
+import cProfile
+import os
+import random
+import time
+
+import click
+from flask import current_app, g, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+
+PROFILE_HEADER = 'X-Profile'
+
+
+def get_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'],
+                                  salt='request-profiler')
+
+
+def profiling_requested() -> bool:
+    # Request is profiled if it has header with valid signed token
+    # (see 'flask profiler-token' command) or if it was sampled
+    token = request.headers.get(PROFILE_HEADER)
+    if token:
+        try:
+            get_serializer().loads(
+                token, max_age=current_app.config['PROFILER_TOKEN_MAX_AGE'])
+            return True
+        except BadSignature:
+            pass
+
+    sample_rate = current_app.config['PROFILER_SAMPLE_RATE']
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def start_profiler():
+    if not profiling_requested():
+        return
+
+    g.profiler = cProfile.Profile()
+    g.profiler_start = time.perf_counter()
+    g.profiler.enable()
+
+
+def stop_profiler(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+
+    profiler.disable()
+    elapsed = (time.perf_counter() - g.pop('profiler_start')) * 1000
+    save_profile(profiler, request.endpoint or 'none', elapsed)
+    return response
+
+
+def save_profile(profiler: cProfile.Profile, endpoint: str, elapsed: float):
+    # Files are named so that sorting them by name sorts them by time,
+    # and the directory works as a ring: when there are more files than
+    # allowed, the oldest ones are deleted
+    directory = current_app.config['PROFILER_DIR']
+    os.makedirs(directory, exist_ok=True)
+
+    now = time.time()
+    filename = '{}{:03d}_{}_{}_{:.0f}ms.prof'.format(
+        time.strftime('%Y%m%d%H%M%S', time.localtime(now)),
+        int(now * 1000) % 1000, os.getpid(), endpoint, elapsed)
+    profiler.dump_stats(os.path.join(directory, filename))
+
+    profiles = sorted(name for name in os.listdir(directory)
+                      if name.endswith('.prof'))
+    for name in profiles[:-current_app.config['PROFILER_MAX_FILES']]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            # Already removed by another worker
+            pass
+
+
+@click.command('profiler-token')
+def profiler_token():
+    # Prints value for 'X-Profile' header that turns on
+    # profiling of requests which send it
+    click.echo(get_serializer().dumps('profile'))
+
+
+def init_app(app):
+    app.cli.add_command(profiler_token)
+
+    # When profiling is disabled hooks are not even registered,
+    # so it costs nothing
+    if not app.config['PROFILER_ENABLED']:
+        return
+
+    app.before_request(start_profiler)
+    app.after_request(stop_profiler)
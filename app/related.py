@@ -0,0 +1,192 @@
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+from heapq import nlargest
+
+from sqlalchemy import select
+
+from . import db
+from .indexes import BackgroundIndex
+from .models import Question, tagged_items
+
+
+class RelatedQuestionsIndex(BackgroundIndex):
+    # In-memory index of related questions, one per worker.
+    # Every question is a sparse binary vector over its tags and
+    # similarity of two questions is the cosine of their vectors:
+    # number of shared tags divided by square root of the product of
+    # numbers of their tags. Vectors are loaded from 'tagged_items'
+    # in batches, top related questions for a question are computed
+    # from the inverted index (tag -> questions) only once and then
+    # served from memory, so 'question_detail' never has to join
+    # 'tagged_items' against itself. Only the newest questions of every
+    # tag are candidates, so computing does not depend on size of tags.
+    # Index is built in background when worker starts and rebuilt in
+    # background from time to time
+
+    def __init__(self):
+        super().__init__()
+        self.count = 5
+        self.batch_size = 1000
+        self.candidates_per_tag = 1000
+        self._lock = threading.RLock()
+        # question id -> frozenset of tag ids
+        self._vectors = {}
+        # tag id -> sorted list of question ids
+        self._postings = {}
+        self._titles = {}
+        # question id -> (versions of its tags, list of
+        # (score, question id)), computed lazily
+        self._related = {}
+        # tag id -> number of times questions of tag changed,
+        # related questions computed before that are stale
+        self._tag_versions = {}
+        # Changes made while index is rebuilt, None when it is not
+        self._changes = None
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.count = app.config.get('RELATED_QUESTIONS_COUNT', self.count)
+        self.batch_size = app.config.get('RELATED_QUESTIONS_BATCH_SIZE',
+                                         self.batch_size)
+        self.candidates_per_tag = app.config.get(
+            'RELATED_QUESTIONS_CANDIDATES_PER_TAG', self.candidates_per_tag)
+        # Other workers patch only their own copy of the index,
+        # so every worker fully rebuilds its copy from time to time
+        self.rebuild_interval = app.config.get(
+            'RELATED_QUESTIONS_REBUILD_INTERVAL', self.rebuild_interval)
+
+    def rebuild(self):
+        # New structures are built without the lock and swapped in at
+        # once, changes this worker made in the meantime are applied
+        # to them first, so they are not lost until the next rebuild
+        with self._lock:
+            self._changes = []
+        try:
+            vectors, postings, titles = self._load()
+        except BaseException:
+            with self._lock:
+                self._changes = None
+            raise
+
+        with self._lock:
+            self._vectors = vectors
+            self._postings = postings
+            self._titles = titles
+            self._related = {}
+            changes, self._changes = self._changes, None
+            for change in changes:
+                self._apply(*change)
+            self._built_at = time.monotonic()
+
+    def _load(self):
+        vectors = {}
+        postings = {}
+        titles = {}
+
+        for question_id, title in db.session.execute(
+                select(Question.id, Question.title)).yield_per(self.batch_size):
+            titles[question_id] = title
+            vectors[question_id] = set()
+
+        for question_id, tag_id in db.session.execute(
+                select(tagged_items.c.question_id, tagged_items.c.tag_id)).\
+                yield_per(self.batch_size):
+            if question_id not in vectors or tag_id is None:
+                continue
+            vectors[question_id].add(tag_id)
+            postings.setdefault(tag_id, []).append(question_id)
+
+        for questions in postings.values():
+            questions.sort()
+        return ({question_id: frozenset(tags)
+                 for question_id, tags in vectors.items()},
+                postings, titles)
+
+    def _compute(self, question_id: int) -> list[tuple[float, int]]:
+        tags = self._vectors.get(question_id)
+        if not tags:
+            return []
+
+        shared = {}
+        for tag_id in tags:
+            # The newest questions of the tag
+            for other_id in \
+                    self._postings.get(tag_id, [])[-self.candidates_per_tag:]:
+                if other_id != question_id:
+                    shared[other_id] = shared.get(other_id, 0) + 1
+
+        scores = (
+            (count / math.sqrt(len(tags) * len(self._vectors[other_id])),
+             other_id)
+            for other_id, count in shared.items()
+        )
+        # Equal scores are ordered by question id,
+        # so newer questions come first
+        return nlargest(self.count, scores)
+
+    def get(self, question_id: int) -> list[tuple[int, str]]:
+        # Returns list of (id, title) of questions related to the given
+        # one, nothing until index is built for the first time
+        self.refresh()
+        with self._lock:
+            versions = tuple(self._tag_versions.get(tag_id, 0) for tag_id
+                             in self._vectors.get(question_id, ()))
+            entry = self._related.get(question_id)
+            if entry is None or entry[0] != versions:
+                entry = (versions, self._compute(question_id))
+                self._related[question_id] = entry
+            return [(other_id, self._titles[other_id])
+                    for _, other_id in entry[1]]
+
+    def update(self, question_id: int, title: str, tag_ids):
+        # Patch index after question was posted, updated or retagged
+        self._change(question_id, title, frozenset(tag_ids))
+
+    def remove(self, question_id: int):
+        self._change(question_id, None, None)
+
+    def _change(self, question_id: int, title: str | None,
+                tags: frozenset | None):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((question_id, title, tags))
+            if self._built_at is not None:
+                self._apply(question_id, title, tags)
+
+    def _apply(self, question_id: int, title: str | None,
+               tags: frozenset | None):
+        # Question without tags (None, not empty set) is removed
+        old_tags = self._vectors.pop(question_id, frozenset())
+        new_tags = tags or frozenset()
+
+        for tag_id in old_tags - new_tags:
+            questions = self._postings.get(tag_id)
+            if questions is not None:
+                position = bisect_left(questions, question_id)
+                if position < len(questions) and \
+                        questions[position] == question_id:
+                    del questions[position]
+                if not questions:
+                    del self._postings[tag_id]
+        for tag_id in new_tags - old_tags:
+            insort(self._postings.setdefault(tag_id, []), question_id)
+
+        if tags is None:
+            self._titles.pop(question_id, None)
+        else:
+            self._vectors[question_id] = new_tags
+            self._titles[question_id] = title
+        self._related.pop(question_id, None)
+        # Only questions that share (or shared) a tag with the changed
+        # question may have it among their related questions, they are
+        # recomputed when they are shown next time. Scores do not
+        # depend on title, so nothing else changes when tags do not
+        if old_tags != new_tags or tags is None:
+            for tag_id in old_tags | new_tags:
+                self._tag_versions[tag_id] = \
+                    self._tag_versions.get(tag_id, 0) + 1
+
+
+related_questions = RelatedQuestionsIndex()
@@ -0,0 +1,75 @@
+import click
+import bleach
+import markdown
+from sqlalchemy import select
+
+from . import db
+from .models import Question, Answer
+
+
+ALLOWED_TAGS = [
+    'a', 'abbr', 'b', 'blockquote', 'br', 'code', 'em', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'hr', 'i', 'li', 'ol', 'p', 'pre', 'strong', 'table',
+    'tbody', 'td', 'th', 'thead', 'tr', 'ul',
+]
+ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title'],
+    'abbr': ['title'],
+}
+
+
+def render_markdown(text: str | None) -> str | None:
+    # Markdown is rendered only when question or answer is created
+    # or updated, and pages show stored HTML. Raw HTML written by user
+    # is not trusted, so everything that is not in the allowed
+    # tags is escaped
+    if not text:
+        return None
+    html = markdown.markdown(text, extensions=['fenced_code', 'tables'])
+    html = bleach.clean(html, tags=ALLOWED_TAGS,
+                        attributes=ALLOWED_ATTRIBUTES,
+                        protocols=['http', 'https', 'mailto'])
+    return bleach.linkify(html)
+
+
+def backfill(model, text_column, html_column, batch_size: int,
+             everything: bool) -> int:
+    rendered = 0
+    last_id = 0
+    while True:
+        # Keyset pagination, so that every batch is cheap to select
+        query = select(model).where(model.id > last_id).\
+            order_by(model.id).limit(batch_size)
+        if not everything:
+            query = query.where(text_column.isnot(None),
+                                html_column.is_(None))
+        objects = db.session.execute(query).scalars().all()
+        if not objects:
+            return rendered
+
+        for obj in objects:
+            setattr(obj, html_column.key,
+                    render_markdown(getattr(obj, text_column.key)))
+        db.session.commit()
+
+        rendered += len(objects)
+        last_id = objects[-1].id
+
+
+@click.command('render-markdown')
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--all', 'everything', is_flag=True,
+              help='Render again also questions and answers '
+                   'that already have HTML.')
+def render_markdown_command(batch_size, everything):
+    # Renders HTML for questions and answers created before
+    # Markdown support was added (or all of them with '--all')
+    questions = backfill(Question, Question.details, Question.details_html,
+                         batch_size, everything)
+    answers = backfill(Answer, Answer.content, Answer.content_html,
+                       batch_size, everything)
+    click.echo(f'Rendered {questions} questions and {answers} answers.')
+
+
+def init_app(app):
+    app.cli.add_command(render_markdown_command)
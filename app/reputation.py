@@ -0,0 +1,114 @@
+import click
+from sqlalchemy import case, func, select, update
+
+from . import db
+from .models import User, Question, Answer, QuestionVote, AnswerVote
+
+
+QUESTION_UPVOTE = 5
+QUESTION_DOWNVOTE = -2
+ANSWER_UPVOTE = 10
+ANSWER_DOWNVOTE = -2
+
+
+def question_vote_points(is_upvote: bool | None) -> int:
+    # None means that there is no vote
+    if is_upvote is None:
+        return 0
+    return QUESTION_UPVOTE if is_upvote else QUESTION_DOWNVOTE
+
+
+def answer_vote_points(is_upvote: bool | None) -> int:
+    if is_upvote is None:
+        return 0
+    return ANSWER_UPVOTE if is_upvote else ANSWER_DOWNVOTE
+
+
+def change_reputation(user_id: int, delta: int):
+    # Reputation is changed in the database and not read and written
+    # back by Python, so votes committed at the same time by other
+    # workers are not lost. Change is committed together with vote
+    if delta:
+        db.session.execute(
+            update(User).where(User.id == user_id).
+            values(reputation=User.reputation + delta))
+
+
+def question_votes_points():
+    return func.sum(case((QuestionVote.is_upvote == True, QUESTION_UPVOTE),
+                         else_=QUESTION_DOWNVOTE))
+
+
+def answer_votes_points():
+    return func.sum(case((AnswerVote.is_upvote == True, ANSWER_UPVOTE),
+                         else_=ANSWER_DOWNVOTE))
+
+
+def answers_reputation(*conditions) -> list[tuple[int, int]]:
+    # Points authors of answers selected by conditions got for them
+    return db.session.execute(
+        select(Answer.user_id, answer_votes_points()).
+        join(AnswerVote, AnswerVote.answer_id == Answer.id).
+        filter(*conditions).
+        group_by(Answer.user_id)).all()
+
+
+def revoke_answers_reputation(*conditions):
+    # Has to be called before answers selected by conditions are
+    # deleted, their votes are deleted together with them
+    for user_id, points in answers_reputation(*conditions):
+        change_reputation(user_id, -points)
+
+
+def revoke_question_reputation(question: Question):
+    # Has to be called before question is deleted
+    points = db.session.execute(
+        select(question_votes_points()).
+        filter(QuestionVote.question_id == question.id)).scalar()
+    change_reputation(question.user_id, -(points or 0))
+    revoke_answers_reputation(Answer.question_id == question.id)
+
+
+def computed_reputation() -> dict[int, int]:
+    # Reputation of users with votes, computed from votes themselves
+    reputation = {}
+    for user_id, points in db.session.execute(
+            select(Question.user_id, question_votes_points()).
+            join(QuestionVote, QuestionVote.question_id == Question.id).
+            group_by(Question.user_id)):
+        reputation[user_id] = reputation.get(user_id, 0) + points
+    for user_id, points in db.session.execute(
+            select(Answer.user_id, answer_votes_points()).
+            join(AnswerVote, AnswerVote.answer_id == Answer.id).
+            group_by(Answer.user_id)):
+        reputation[user_id] = reputation.get(user_id, 0) + points
+    return reputation
+
+
+def recompute_reputation() -> int:
+    reputation = computed_reputation()
+
+    # Only users whose stored reputation is wrong are updated
+    changed = [
+        {'id': user_id, 'reputation': reputation.get(user_id, 0)}
+        for user_id, stored in db.session.execute(
+            select(User.id, User.reputation))
+        if stored != reputation.get(user_id, 0)
+    ]
+    if changed:
+        db.session.execute(update(User), changed)
+    db.session.commit()
+    return len(changed)
+
+
+@click.command('recompute-reputation')
+def recompute_reputation_command():
+    # Computes reputation of all users from votes again,
+    # fixes reputation of users who existed before it was
+    # counted or whose reputation drifted
+    changed = recompute_reputation()
+    click.echo(f'Fixed reputation of {changed} users.')
+
+
+def init_app(app):
+    app.cli.add_command(recompute_reputation_command)
@@ -0,0 +1,92 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from .shared_cache import shared_cache
+
+
+GENERATION_KEY = 'search:generation'
+# Generation is read by every search, so it is not evicted
+# while searches are made, expiring only makes entries stale
+GENERATION_TTL = 24 * 60 * 60
+
+
+def normalize_query(query: str) -> str:
+    # Queries that differ only in case or whitespace
+    # share one entry of the cache
+    return ' '.join(query.casefold().split())
+
+
+class SearchCache:
+    # Cache of search results, one per worker. Only ordered lists of
+    # ids of found questions are stored, questions themselves are
+    # selected by ids when results are shown.
+    # Every entry remembers generation of questions it was computed
+    # for, and generation is changed whenever a question is created,
+    # updated or deleted, so all entries become stale at once without
+    # walking over them. Generation is kept in the shared cache, so a
+    # change made by one worker makes entries of all of them stale.
+    # It is read before results are computed, so results computed
+    # while a question was changed are never stored as fresh ones.
+    # Without shared cache every worker counts its own generation and
+    # changes made by other workers are picked up when entries expire
+
+    def __init__(self):
+        self.size = 1000
+        self.ttl = 60
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def init_app(self, app):
+        self.size = app.config.get('SEARCH_CACHE_SIZE', self.size)
+        self.ttl = app.config.get('SEARCH_CACHE_TTL', self.ttl)
+
+    def current_generation(self) -> str | int:
+        if not shared_cache.enabled:
+            return self.generation
+        generation = shared_cache.get(GENERATION_KEY)
+        if generation is None:
+            # Generation was evicted or expired, new one makes all
+            # entries stale. The first worker to store it wins, if
+            # shared cache can not be used, generation of worker is
+            generation = secrets.token_hex(8)
+            if not shared_cache.add(GENERATION_KEY, generation,
+                                    GENERATION_TTL):
+                generation = shared_cache.get(GENERATION_KEY,
+                                              self.generation)
+        return generation
+
+    def get(self, query: str, generation) -> list[int] | None:
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is None:
+                return None
+            entry_generation, expires, question_ids = entry
+            if entry_generation != generation or \
+                    expires < time.monotonic():
+                del self._entries[query]
+                return None
+            self._entries.move_to_end(query)
+            return question_ids
+
+    def set(self, query: str, question_ids: list[int], generation):
+        # Generation must be read before question_ids were selected
+        with self._lock:
+            self._entries[query] = (generation,
+                                    time.monotonic() + self.ttl,
+                                    question_ids)
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def bump_generation(self):
+        with self._lock:
+            self.generation += 1
+        if shared_cache.enabled:
+            shared_cache.set(GENERATION_KEY, secrets.token_hex(8),
+                             GENERATION_TTL)
+
+
+search_cache = SearchCache()
@@ -0,0 +1,327 @@
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import secrets
+import stat
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import SHARED_CACHE_OVERSIZED
+
+
+MAGIC = b'ASKLEE01'
+# Magic, number of sets, ways in every set and size of slot
+FILE_HEADER = struct.Struct('<8sIII')
+# Hand of CLOCK of the set
+SET_HEADER = struct.Struct('<I4x')
+# Digest of key, expiration time (0 for empty slot),
+# reference bit and length of value
+SLOT_HEADER = struct.Struct('<16sdB3xI')
+REFERENCED_OFFSET = 24
+
+_missing = object()
+
+logger = logging.getLogger(__name__)
+
+
+def key_digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+
+def encode(value) -> bytes:
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+class SharedCache:
+    # Cache in memory-mapped file, shared by all workers on a node, so
+    # that hot data is built once and kept once instead of in every
+    # worker. File is split into sets of fixed-size slots, key is hashed
+    # to one set and can be in any of its slots. When set is full, slot
+    # to reuse is chosen by CLOCK: every read marks the slot, and the
+    # hand of the set skips (and unmarks) marked slots, so recently read
+    # entries survive. Set is locked with record lock on its bytes of
+    # file while it is read or written, so different keys are read and
+    # written by workers in parallel.
+    # Values are stored as JSON, so only dicts, lists, strings, numbers,
+    # booleans and None can be cached, and tuples come back as lists.
+    # File is kept in instance folder by default. It is not used unless
+    # it belongs to user of the process and is readable and writable by
+    # that user only. Values bigger than slot are not cached, they
+    # are logged and counted, long lists are cached with 'set_list'
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.slots = 2048
+        self.ways = 8
+        self.slot_size = 16 * 1024
+        self.ttl = 60
+        self._lock = threading.Lock()
+        self._fd = None
+        self._map = None
+        self._layout = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SHARED_CACHE_ENABLED', self.enabled)
+        self.path = app.config.get('SHARED_CACHE_PATH') or \
+            os.path.join(app.instance_path, 'shared_cache')
+        self.slots = app.config.get('SHARED_CACHE_SLOTS', self.slots)
+        self.ways = app.config.get('SHARED_CACHE_WAYS', self.ways)
+        self.slot_size = app.config.get('SHARED_CACHE_SLOT_SIZE',
+                                        self.slot_size)
+        self.ttl = app.config.get('SHARED_CACHE_TTL', self.ttl)
+
+    @property
+    def sets(self) -> int:
+        return max(1, self.slots // self.ways)
+
+    @property
+    def set_size(self) -> int:
+        return SET_HEADER.size + self.ways * self.slot_size
+
+    @property
+    def size(self) -> int:
+        return FILE_HEADER.size + self.sets * self.set_size
+
+    def _open(self) -> bool:
+        # Opened in worker process itself, after gunicorn forked it,
+        # record locks belong to process that took them.
+        # Returns whether file can be used
+        pid = os.getpid()
+        if self._pid == pid:
+            return self._map is not None
+        self._pid = pid
+        self._map = None
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            # Symbolic link put in place of the file is not followed
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW |
+                         os.O_CLOEXEC, 0o600)
+        except OSError as e:
+            logger.error('Shared cache is not used: %s', e)
+            return False
+        status = os.fstat(fd)
+        if not stat.S_ISREG(status.st_mode) or \
+                status.st_uid != os.getuid() or \
+                stat.S_IMODE(status.st_mode) != 0o600:
+            os.close(fd)
+            logger.error('Shared cache is not used: %s must be a regular '
+                         'file of user %d with mode 0600.',
+                         self.path, os.getuid())
+            return False
+
+        header = FILE_HEADER.pack(MAGIC, self.sets, self.ways, self.slot_size)
+        # The first worker creates the file, file with another
+        # layout is left from the previous configuration
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size != self.size or \
+                    os.pread(fd, FILE_HEADER.size, 0) != header:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, header, 0)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._map = mmap.mmap(fd, self.size)
+        self._layout = (self.sets, self.set_size, self.ways, self.slot_size)
+        return True
+
+    def _available(self) -> bool:
+        if not self.enabled:
+            return False
+        with self._lock:
+            return self._open()
+
+    @contextmanager
+    def _locked_set(self, digest: bytes, operation=fcntl.LOCK_EX):
+        # Locks set the key with digest is in and yields its offset.
+        # Record locks do not exclude threads of one process
+        with self._lock:
+            sets, set_size, _, _ = self._layout
+            set_start = FILE_HEADER.size + \
+                int.from_bytes(digest[:8], 'little') % sets * set_size
+            fcntl.lockf(self._fd, operation, set_size, set_start)
+            try:
+                yield set_start
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, set_size, set_start)
+
+    def _slots(self, set_start: int) -> range:
+        # Offsets of slots of the set
+        _, _, ways, slot_size = self._layout
+        first = set_start + SET_HEADER.size
+        return range(first, first + ways * slot_size, slot_size)
+
+    def get(self, key: str, default=None):
+        if not self._available():
+            return default
+        digest = key_digest(key)
+        now = time.time()
+        data = None
+        # Readers share the lock, the reference bit they set
+        # is only ever set to 1 by them, so they do not race
+        with self._locked_set(digest, fcntl.LOCK_SH) as set_start:
+            for slot in self._slots(set_start):
+                if self._map[slot:slot + 16] != digest:
+                    continue
+                _, expires, _, length = SLOT_HEADER.unpack_from(self._map,
+                                                                slot)
+                if expires > now:
+                    self._map[slot + REFERENCED_OFFSET] = 1
+                    value_start = slot + SLOT_HEADER.size
+                    data = self._map[value_start:value_start + length]
+                break
+        if data is None:
+            return default
+        return json.loads(data)
+
+    @property
+    def payload_size(self) -> int:
+        return self.slot_size - SLOT_HEADER.size
+
+    def set(self, key: str, value, ttl: float | None = None) -> bool:
+        if not self._available():
+            return False
+        return self._store(key, encode(value), ttl)
+
+    def add(self, key: str, value, ttl: float | None = None) -> bool:
+        # Like 'set', but only if key is not cached yet,
+        # returns whether value was stored
+        if not self._available():
+            return False
+        return self._store(key, encode(value), ttl, replace=False)
+
+    def _store(self, key: str, data: bytes, ttl: float | None,
+               replace: bool = True) -> bool:
+        if len(data) > self.payload_size:
+            # Key is counted by its prefix, so that
+            # ids do not create new label values
+            SHARED_CACHE_OVERSIZED.labels(key.split(':', 1)[0]).inc()
+            logger.warning('Value of %s is not cached, it takes %d bytes '
+                           'and slot holds %d.', key, len(data),
+                           self.payload_size)
+            return False
+        digest = key_digest(key)
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+
+        with self._locked_set(digest) as set_start:
+            slots = self._slots(set_start)
+            headers = [SLOT_HEADER.unpack_from(self._map, slot)
+                       for slot in slots]
+            # Slot of the same key, or empty or expired
+            # slot, or slot the hand of CLOCK stops at
+            way = next((way for way, header in enumerate(headers)
+                        if header[0] == digest), None)
+            if way is not None and not replace and headers[way][1] > now:
+                return False
+            if way is None:
+                way = next((way for way, header in enumerate(headers)
+                            if header[1] <= now), None)
+            if way is None:
+                (hand,) = SET_HEADER.unpack_from(self._map, set_start)
+                for step in range(2 * len(slots)):
+                    way = (hand + step) % len(slots)
+                    if not self._map[slots[way] + REFERENCED_OFFSET]:
+                        break
+                    self._map[slots[way] + REFERENCED_OFFSET] = 0
+                SET_HEADER.pack_into(self._map, set_start,
+                                     (way + 1) % len(slots))
+
+            slot = slots[way]
+            value_start = slot + SLOT_HEADER.size
+            self._map[value_start:value_start + len(data)] = data
+            SLOT_HEADER.pack_into(self._map, slot, digest, expires, 0,
+                                  len(data))
+        return True
+
+    def delete(self, key: str):
+        if not self._available():
+            return
+        digest = key_digest(key)
+        with self._locked_set(digest) as set_start:
+            for slot in self._slots(set_start):
+                if self._map[slot:slot + 16] == digest:
+                    SLOT_HEADER.pack_into(self._map, slot,
+                                          bytes(16), 0.0, 0, 0)
+
+    def get_or_set(self, key: str, build, ttl: float | None = None):
+        # Value is built by every worker that misses it at the same
+        # time, the last one to build it is kept
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = build()
+            self.set(key, value, ttl)
+        return value
+
+    def set_list(self, key: str, items: list,
+                 ttl: float | None = None) -> bool:
+        # List that does not fit in one slot is split in chunks that do.
+        # Chunks are stored under keys with random version, and the key
+        # itself, written last, names version and number of chunks, so
+        # chunks of two lists are never read together
+        if not self._available():
+            return False
+        chunks = []
+        chunk = []
+        size = 2
+        for item in map(encode, items):
+            if chunk and size + len(item) + 1 > self.payload_size:
+                chunks.append(chunk)
+                chunk = []
+                size = 2
+            chunk.append(item)
+            size += len(item) + 1
+        chunks.append(chunk)
+
+        version = secrets.token_hex(8)
+        for number, chunk in enumerate(chunks):
+            if not self._store(f'{key}:{version}:{number}',
+                               b'[' + b','.join(chunk) + b']', ttl):
+                return False
+        return self.set(key, [version, len(chunks)], ttl)
+
+    def get_list(self, key: str, default=None):
+        head = self.get(key)
+        if head is None:
+            return default
+        version, count = head
+        items = []
+        for number in range(count):
+            chunk = self.get(f'{key}:{version}:{number}')
+            # Chunk was evicted before the list expired
+            if chunk is None:
+                return default
+            items.extend(chunk)
+        return items
+
+    def get_or_set_list(self, key: str, build, ttl: float | None = None):
+        items = self.get_list(key, _missing)
+        if items is _missing:
+            items = build()
+            self.set_list(key, items, ttl)
+        return items
+
+    def clear(self):
+        if not self._available():
+            return
+        with self._lock:
+            # Length 0 locks the whole file
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                self._map[FILE_HEADER.size:] = \
+                    bytes(len(self._map) - FILE_HEADER.size)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+
+shared_cache = SharedCache()
@@ -0,0 +1,149 @@
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from flask import (Blueprint, Response, abort, current_app, send_file,
+                   stream_with_context, url_for)
+from sqlalchemy import func, select
+
+from . import db
+from .models import Question, Tag, tagged_items
+
+bp = Blueprint('sitemap', __name__)
+
+# Maximal number of urls in one sitemap file allowed by sitemaps protocol
+CHUNK_SIZE = 50000
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def chunks_count(model) -> int:
+    # Child sitemaps cover ranges of ids, so number of them
+    # is known from maximal id and every one is selected by
+    # primary key range, even if some ids were deleted
+    max_id = db.session.query(func.max(model.id)).scalar() or 0
+    return max(1, -(-max_id // CHUNK_SIZE))
+
+
+def chunk_range(chunk: int) -> tuple[int, int]:
+    return chunk * CHUNK_SIZE + 1, (chunk + 1) * CHUNK_SIZE
+
+
+def question_urls(chunk: int):
+    first_id, last_id = chunk_range(chunk)
+    rows = db.session.execute(
+        select(Question.id, func.coalesce(Question.updated, Question.asked)).
+        filter(Question.id.between(first_id, last_id)).
+        order_by(Question.id).
+        execution_options(yield_per=1000))
+    for question_id, lastmod in rows:
+        yield url_for('main.question_detail', id=question_id,
+                      _external=True), lastmod
+
+
+def tag_urls(chunk: int):
+    first_id, last_id = chunk_range(chunk)
+    rows = db.session.execute(
+        select(Tag.name).
+        filter(Tag.id.between(first_id, last_id),
+               Tag.id.in_(select(tagged_items.c.tag_id))).
+        order_by(Tag.id).
+        execution_options(yield_per=1000))
+    for name, in rows:
+        yield url_for('main.questions_by_tag', tag=name,
+                      _external=True), None
+
+
+def render_urlset(urls):
+    yield XML_HEADER + f'<urlset xmlns="{NAMESPACE}">\n'
+    for location, lastmod in urls:
+        if lastmod is None:
+            yield f'<url><loc>{escape(location)}</loc></url>\n'
+        else:
+            yield (f'<url><loc>{escape(location)}</loc>'
+                   f'<lastmod>{lastmod.strftime("%Y-%m-%dT%H:%M:%S+00:00")}'
+                   f'</lastmod></url>\n')
+    yield '</urlset>\n'
+
+
+def chunk_signature(kind: str, chunk: int) -> str:
+    # Child sitemap has to be generated again only when
+    # something was added, updated or deleted in its range
+    first_id, last_id = chunk_range(chunk)
+    if kind == 'questions':
+        count, lastmod = db.session.execute(
+            select(func.count(Question.id),
+                   func.max(func.coalesce(Question.updated, Question.asked))).
+            filter(Question.id.between(first_id, last_id))).one()
+        lastmod = lastmod.strftime('%Y%m%d%H%M%S%f') if lastmod else '0'
+        return f'{count}-{lastmod}'
+
+    count, max_id = db.session.execute(
+        select(func.count(func.distinct(tagged_items.c.tag_id)),
+               func.max(tagged_items.c.tag_id)).
+        filter(tagged_items.c.tag_id.between(first_id, last_id))).one()
+    return f'{count}-{max_id or 0}'
+
+
+def cached_stream(path: str, stale_prefix: str, chunks):
+    # Streams chunks to client and writes them to a temporary file at
+    # the same time, file is put in place only if generation finished
+    directory = os.path.dirname(path)
+    # Unique name, threads and workers may generate the same file at once
+    fd, temporary_path = tempfile.mkstemp(
+        prefix=f'{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    # mkstemp creates file readable by owner only, sitemaps are public
+    os.fchmod(fd, 0o644)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            for chunk in chunks:
+                file.write(chunk)
+                yield chunk
+    except BaseException:
+        # Client went away before the whole file was generated
+        os.remove(temporary_path)
+        raise
+
+    for name in os.listdir(directory):
+        if name.startswith(stale_prefix) and name.endswith('.xml'):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+    os.replace(temporary_path, path)
+
+
+@bp.route('/sitemap.xml')
+def sitemap_index():
+    def generate():
+        yield XML_HEADER + f'<sitemapindex xmlns="{NAMESPACE}">\n'
+        for kind, model in (('questions', Question), ('tags', Tag)):
+            for chunk in range(chunks_count(model)):
+                location = url_for('sitemap.sitemap_chunk', kind=kind,
+                                   chunk=chunk, _external=True)
+                yield f'<sitemap><loc>{escape(location)}</loc></sitemap>\n'
+        yield '</sitemapindex>\n'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/xml')
+
+
+@bp.route('/sitemaps/<any(questions, tags):kind>-<int:chunk>.xml')
+def sitemap_chunk(kind, chunk):
+    if chunk >= chunks_count(Question if kind == 'questions' else Tag):
+        abort(404)
+
+    directory = current_app.config['SITEMAP_DIR']
+    os.makedirs(directory, exist_ok=True)
+    prefix = f'{kind}-{chunk}-'
+    path = os.path.join(directory,
+                        f'{prefix}{chunk_signature(kind, chunk)}.xml')
+
+    if os.path.exists(path):
+        return send_file(os.path.abspath(path), mimetype='application/xml')
+
+    urls = question_urls(chunk) if kind == 'questions' else tag_urls(chunk)
+    return Response(
+        stream_with_context(cached_stream(path, prefix, render_urlset(urls))),
+        mimetype='application/xml')
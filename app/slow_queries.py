@@ -0,0 +1,265 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, datetime
+from logging.handlers import RotatingFileHandler
+
+import click
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Placeholders of parameters in all paramstyles SQLAlchemy uses
+PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+# 'IN (?, ?, ?)' with any number of values has the same shape
+PLACEHOLDERS_LIST = re.compile(
+    rf'\(\s*{PLACEHOLDER}(?:\s*,\s*{PLACEHOLDER})*\s*\)')
+
+# Values bound to columns with such names are never written to logs
+SENSITIVE_PARAMETER = re.compile(r'password|email|token|secret',
+                                 re.IGNORECASE)
+
+EXPLAIN_PREFIXES = {
+    'sqlite': ('EXPLAIN QUERY PLAN ', 'EXPLAIN QUERY PLAN '),
+    'postgresql': ('EXPLAIN ', 'EXPLAIN (ANALYZE, BUFFERS) '),
+    'mysql': ('EXPLAIN ', 'EXPLAIN ANALYZE '),
+}
+
+
+def statement_shape(statement: str) -> str:
+    return PLACEHOLDERS_LIST.sub('(...)', ' '.join(statement.split()))
+
+
+def statement_fingerprint(shape: str) -> str:
+    return hashlib.blake2b(shape.encode(), digest_size=8).hexdigest()
+
+
+def json_value(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= 200 else value[:200] + '...'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'<{len(value)} bytes>'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {str(key): json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_value(item) for item in value]
+    return str(value)
+
+
+def redact(parameters: dict) -> dict:
+    return {name: '<redacted>' if SENSITIVE_PARAMETER.search(name)
+            else json_value(value) for name, value in parameters.items()}
+
+
+class SlowQueryLog:
+    # Records SQL statements that took longer than threshold, with
+    # endpoint of request that ran them, as lines of JSON. The first
+    # time a statement of some shape is slow in a worker, its plan is
+    # recorded too. Every worker writes its own rotating file in the
+    # directory, so files are never rotated by two processes at once.
+    # Parameters are recorded only if it is turned on, by names of
+    # binds, and values of passwords, emails and the like are redacted.
+    # Statements with such parameters are not explained, plans may
+    # show the values
+
+    def __init__(self):
+        self.enabled = False
+        self.threshold = 0.2
+        self.explain_analyze = False
+        self.log_parameters = False
+        self.directory = 'slow_queries'
+        self.max_bytes = 10 * 1024 * 1024
+        self.backups = 5
+        self._lock = threading.Lock()
+        self._explained = set()
+        self._logger = None
+        self._pid = None
+
+    def init_app(self, app):
+        app.cli.add_command(slow_queries)
+        self.enabled = app.config['SLOW_QUERY_ENABLED']
+        if not self.enabled:
+            return
+
+        self.threshold = app.config['SLOW_QUERY_THRESHOLD']
+        self.explain_analyze = app.config['SLOW_QUERY_EXPLAIN_ANALYZE']
+        self.log_parameters = app.config['SLOW_QUERY_LOG_PARAMETERS']
+        self.directory = app.config['SLOW_QUERY_DIR']
+        self.max_bytes = app.config['SLOW_QUERY_LOG_MAX_BYTES']
+        self.backups = app.config['SLOW_QUERY_LOG_BACKUPS']
+
+        if not event.contains(Engine, 'before_cursor_execute',
+                              before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         after_cursor_execute)
+
+    def get_logger(self) -> logging.Logger:
+        # Created in worker process itself, after gunicorn forked it
+        pid = os.getpid()
+        if self._pid != pid:
+            os.makedirs(self.directory, exist_ok=True)
+            handler = RotatingFileHandler(
+                os.path.join(self.directory, f'slow_queries_{pid}.jsonl'),
+                maxBytes=self.max_bytes, backupCount=self.backups,
+                encoding='utf-8')
+            logger = logging.getLogger(f'{__name__}.{pid}')
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            logger.handlers = [handler]
+            self._logger = logger
+            self._pid = pid
+        return self._logger
+
+    def explain(self, conn, cursor, statement: str, parameters) -> dict:
+        dialect = conn.dialect.name
+        prefixes = EXPLAIN_PREFIXES.get(dialect)
+        if prefixes is None:
+            return {'error': f'EXPLAIN is not supported for {dialect}'}
+        prefix = prefixes[1] if self.explain_analyze else prefixes[0]
+
+        # Plan is read with raw DBAPI cursor, so that it is not seen by
+        # SQLAlchemy events. In PostgreSQL failed statement would abort
+        # transaction of request, so EXPLAIN runs in a savepoint
+        explain_cursor = cursor.connection.cursor()
+        savepoint = dialect == 'postgresql'
+        try:
+            if savepoint:
+                explain_cursor.execute('SAVEPOINT slow_query_explain')
+            explain_cursor.execute(prefix + statement, parameters)
+            plan = [' '.join(str(column) for column in row)
+                    for row in explain_cursor.fetchall()]
+            if savepoint:
+                explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+            return {'analyze': self.explain_analyze, 'plan': plan}
+        except Exception as e:
+            if savepoint:
+                explain_cursor.execute(
+                    'ROLLBACK TO SAVEPOINT slow_query_explain')
+            return {'error': str(e)}
+        finally:
+            explain_cursor.close()
+
+    def record(self, conn, cursor, statement: str, parameters, context,
+               executemany: bool, duration: float):
+        shape = statement_shape(statement)
+        fingerprint = statement_fingerprint(shape)
+        entry = {
+            'time': datetime.utcnow().isoformat(),
+            'pid': os.getpid(),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'duration_ms': round(duration * 1000, 3),
+            'fingerprint': fingerprint,
+            'statement': shape,
+        }
+
+        # Parameters of plain SQL statements have no names,
+        # so they can not be told apart and are all sensitive
+        named = getattr(context, 'compiled_parameters', None)
+        sensitive = named is None or any(
+            SENSITIVE_PARAMETER.search(name)
+            for parameters in named[:1] for name in parameters)
+        if self.log_parameters:
+            if named is None:
+                entry['parameters'] = None
+            elif executemany:
+                entry['parameters'] = [redact(item) for item in named]
+            else:
+                entry['parameters'] = redact(named[0]) if named else {}
+
+        with self._lock:
+            first = fingerprint not in self._explained
+            self._explained.add(fingerprint)
+        # Plans of statements that change data are not read,
+        # EXPLAIN ANALYZE would change it again
+        if first and not executemany and not sensitive and \
+                shape.lstrip('( ').upper().startswith(('SELECT', 'WITH')):
+            entry['explain'] = self.explain(conn, cursor, statement,
+                                            parameters)
+
+        self.get_logger().info(json.dumps(entry, ensure_ascii=False))
+
+
+slow_query_log = SlowQueryLog()
+
+
+def before_cursor_execute(conn, cursor, statement, parameters,
+                          context, executemany):
+    conn.info['slow_query_start'] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters,
+                         context, executemany):
+    start = conn.info.pop('slow_query_start', None)
+    if start is None or not slow_query_log.enabled:
+        return
+    duration = time.perf_counter() - start
+    if duration >= slow_query_log.threshold:
+        slow_query_log.record(conn, cursor, statement, parameters,
+                              context, executemany, duration)
+
+
+def read_entries(directory: str):
+    for path in glob.glob(os.path.join(directory, 'slow_queries_*.jsonl*')):
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Line that was being written when file was read
+                    continue
+
+
+@click.command('slow-queries')
+@click.option('--limit', default=10, show_default=True,
+              help='Number of statements to show.')
+@click.option('--sort', type=click.Choice(['total', 'max', 'count']),
+              default='total', show_default=True)
+@click.option('--plans', is_flag=True, help='Show recorded plans.')
+def slow_queries(limit, sort, plans):
+    # Summarizes slow query logs of all workers
+    # by shape of statement, the worst ones first
+    statements = {}
+    for entry in read_entries(current_app.config['SLOW_QUERY_DIR']):
+        summary = statements.setdefault(entry['fingerprint'], {
+            'statement': entry['statement'], 'count': 0, 'total': 0.0,
+            'max': 0.0, 'endpoints': set(), 'explain': None})
+        summary['count'] += 1
+        summary['total'] += entry['duration_ms']
+        summary['max'] = max(summary['max'], entry['duration_ms'])
+        if entry['endpoint']:
+            summary['endpoints'].add(entry['endpoint'])
+        if entry.get('explain') and summary['explain'] is None:
+            summary['explain'] = entry['explain']
+
+    if not statements:
+        click.echo('No slow queries were recorded.')
+        return
+
+    worst = sorted(statements.values(), key=lambda summary: summary[sort],
+                   reverse=True)[:limit]
+    for summary in worst:
+        click.echo(f'{summary["count"]} times, total '
+                   f'{summary["total"]:.1f} ms, mean '
+                   f'{summary["total"] / summary["count"]:.1f} ms, max '
+                   f'{summary["max"]:.1f} ms, endpoints: '
+                   f'{", ".join(sorted(summary["endpoints"])) or "-"}')
+        click.echo(f'    {summary["statement"]}')
+        if plans and summary['explain']:
+            if 'error' in summary['explain']:
+                click.echo(f'    EXPLAIN failed: '
+                           f'{summary["explain"]["error"]}')
+            for line in summary['explain'].get('plan', []):
+                click.echo(f'        {line}')
+        click.echo()
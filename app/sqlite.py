@@ -0,0 +1,65 @@
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import db
+
+
+# Execution option of connection (see 'write_transaction') that makes
+# transaction begin as a write transaction outside of write requests
+WRITE_TRANSACTION = 'sqlite_write_transaction'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def write_transaction(session: Session) -> None:
+    # Begins transaction of the session as a write transaction, call it
+    # before the first statement of transaction which will write
+    # during GET request (like 'SELECT ... FOR UPDATE' in PostgreSQL).
+    # Does nothing for other databases
+    session.connection(execution_options={WRITE_TRANSACTION: True})
+
+
+def set_pragmas(pragmas: dict):
+    def on_connect(dbapi_connection, connection_record):
+        # pysqlite begins transactions by itself only before
+        # writing statements, so it is turned off and transactions
+        # are begun in 'on_begin'
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    return on_connect
+
+
+def on_begin(conn):
+    # Write transactions take the write lock of database right away.
+    # Writers of all workers wait for each other in busy handler of
+    # SQLite ('busy_timeout') instead of failing with 'database is
+    # locked' when transaction that already read something tries to
+    # write after another worker committed. Read transactions do not
+    # take any lock and in WAL mode are not blocked by the writer
+    options = conn.get_execution_options()
+    if options.get('isolation_level') == 'AUTOCOMMIT':
+        # Like 'PRAGMA foreign_keys' in migrations,
+        # which must run outside of transaction
+        return
+    write = options.get(WRITE_TRANSACTION) or \
+        (has_request_context() and request.method not in SAFE_METHODS)
+    conn.exec_driver_sql('BEGIN IMMEDIATE' if write else 'BEGIN')
+
+
+def init_app(app):
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    event.listen(engine, 'connect', set_pragmas(pragmas))
+    event.listen(engine, 'begin', on_begin)
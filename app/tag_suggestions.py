@@ -0,0 +1,118 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from heapq import nlargest
+
+from sqlalchemy import func, select
+
+from . import db
+from .indexes import BackgroundIndex
+from .models import Tag, tagged_items
+
+
+def normalize_tag(tag: str) -> str:
+    # Normalization of every tag name that is stored or looked up:
+    # tags of questions ('split_tags_string'), aliases of synonyms,
+    # tags in urls and prefixes typed by user
+    return '-'.join(tag.strip().lower().split())
+
+
+class TagSuggestionsIndex(BackgroundIndex):
+    # In-memory prefix index of tag names, one per worker.
+    # Names are kept in sorted list, so all tags starting with
+    # some prefix lie next to each other and are found with bisect,
+    # and suggestions are ordered by number of questions with tag.
+    # Index is built in background when worker starts and then patched
+    # when tags are attached to or detached from questions in this
+    # worker, so suggestions never touch database. It is rebuilt in
+    # background from time to time to see tags attached and detached
+    # by other workers
+
+    def __init__(self):
+        super().__init__()
+        self.limit = 10
+        self._lock = threading.Lock()
+        self._names = []
+        self._popularity = {}
+        # Changes made while index is rebuilt, None when it is not
+        self._changes = None
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.limit = app.config.get('TAG_SUGGESTIONS_LIMIT', self.limit)
+        self.rebuild_interval = app.config.get(
+            'TAG_SUGGESTIONS_RELOAD_INTERVAL', self.rebuild_interval)
+
+    def rebuild(self):
+        # Changes this worker made while popularity was counted
+        # are applied to the new copy before it is swapped in
+        with self._lock:
+            self._changes = []
+        try:
+            popularity = {}
+            for name, questions_count in db.session.execute(
+                    select(Tag.name, func.count(tagged_items.c.question_id)).
+                    outerjoin(tagged_items, tagged_items.c.tag_id == Tag.id).
+                    group_by(Tag.id, Tag.name)):
+                if name:
+                    popularity[name] = \
+                        popularity.get(name, 0) + questions_count
+        except BaseException:
+            with self._lock:
+                self._changes = None
+            raise
+
+        with self._lock:
+            self._popularity = popularity
+            self._names = sorted(popularity)
+            changes, self._changes = self._changes, None
+            for names, delta in changes:
+                self._apply(names, delta)
+            self._built_at = time.monotonic()
+
+    def suggest(self, prefix: str) -> list[str]:
+        # Nothing is suggested until index is built for the first time
+        self.refresh()
+
+        prefix = normalize_tag(prefix)
+        if not prefix:
+            return []
+
+        with self._lock:
+            start = bisect_left(self._names, prefix)
+            end = bisect_left(self._names, prefix + '\U0010ffff', start)
+            matches = self._names[start:end]
+            if len(matches) <= self.limit:
+                return sorted(matches,
+                              key=lambda name: -self._popularity[name])
+            return nlargest(self.limit, matches,
+                            key=lambda name: self._popularity[name])
+
+    def add(self, names):
+        # Call with names of tags that were attached to a question
+        self._change(list(names), 1)
+
+    def discard(self, names):
+        # Call with names of tags that were detached from a question
+        self._change(list(names), -1)
+
+    def _change(self, names: list[str], delta: int):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((names, delta))
+            if self._built_at is not None:
+                self._apply(names, delta)
+
+    def _apply(self, names: list[str], delta: int):
+        # New tags are inserted in their place in sorted list.
+        # Tags themselves are never deleted, so names stay in index
+        for name in names:
+            if name not in self._popularity:
+                if delta < 0:
+                    continue
+                insort(self._names, name)
+                self._popularity[name] = 0
+            self._popularity[name] = max(self._popularity[name] + delta, 0)
+
+
+tag_suggestions = TagSuggestionsIndex()
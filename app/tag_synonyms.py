@@ -0,0 +1,145 @@
+import threading
+import time
+from datetime import datetime
+
+import click
+from sqlalchemy import delete, insert, select, update
+
+from . import db
+from .indexes import BackgroundIndex
+from .models import Tag, TagSynonym, tagged_items
+from .tag_suggestions import normalize_tag
+
+
+class TagSynonyms(BackgroundIndex):
+    # Map of aliases of tags to names of canonical tags, one per
+    # worker, so that 'py3' and 'python3' are written and looked up as
+    # 'python'. Synonyms are loaded in background when worker starts
+    # and reloaded in background from time to time to see synonyms
+    # added by 'flask add-tag-synonym', so every lookup is a dictionary
+    # lookup and requests never wait for the query
+
+    def __init__(self):
+        super().__init__()
+        self.rebuild_interval = 60
+        self._lock = threading.Lock()
+        self._canonical = {}
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.rebuild_interval = app.config.get('TAG_SYNONYMS_RELOAD_INTERVAL',
+                                               self.rebuild_interval)
+        app.cli.add_command(add_tag_synonym)
+        app.cli.add_command(merge_tag_synonyms)
+
+    def rebuild(self):
+        canonical = dict(db.session.execute(
+            select(TagSynonym.alias, Tag.name).
+            join(Tag, Tag.id == TagSynonym.tag_id)).all())
+
+        with self._lock:
+            self._canonical = canonical
+            self._built_at = time.monotonic()
+
+    def canonical(self, name: str) -> str:
+        # Takes name of tag normalized with 'normalize_tag' and returns
+        # name of canonical tag or the name itself, aliases are not
+        # replaced until synonyms are loaded for the first time
+        self.refresh()
+        return self._canonical.get(name, name)
+
+    def resolve(self, names: list[str]) -> list[str]:
+        # Replaces aliases in list of names,
+        # names that become duplicates are dropped
+        self.refresh()
+        canonical = self._canonical
+        return list(dict.fromkeys(canonical.get(name, name)
+                                  for name in names))
+
+
+def merge_tag(alias_tag_id: int, canonical_tag_id: int,
+              batch_size: int) -> int:
+    # Moves questions of alias tag to canonical tag in batches, questions
+    # that already have canonical tag just lose alias tag
+    merged = 0
+    while True:
+        question_ids = db.session.execute(
+            select(tagged_items.c.question_id).
+            filter(tagged_items.c.tag_id == alias_tag_id).
+            order_by(tagged_items.c.question_id).
+            limit(batch_size)).scalars().all()
+        if not question_ids:
+            return merged
+
+        tagged = set(db.session.execute(
+            select(tagged_items.c.question_id).
+            filter(tagged_items.c.tag_id == canonical_tag_id,
+                   tagged_items.c.question_id.in_(question_ids))).scalars())
+        untagged = [question_id for question_id in question_ids
+                    if question_id not in tagged]
+        if untagged:
+            db.session.execute(insert(tagged_items), [
+                {'tag_id': canonical_tag_id, 'question_id': question_id}
+                for question_id in untagged])
+        db.session.execute(
+            delete(tagged_items).
+            where(tagged_items.c.tag_id == alias_tag_id,
+                  tagged_items.c.question_id.in_(question_ids)))
+        # Feed of canonical tag got questions of alias tag
+        db.session.execute(
+            update(Tag).where(Tag.id == canonical_tag_id).
+            values(changed=datetime.utcnow()))
+        db.session.commit()
+        merged += len(question_ids)
+
+
+@click.command('add-tag-synonym')
+@click.argument('alias')
+@click.argument('tag')
+def add_tag_synonym(alias, tag):
+    # Makes ALIAS a synonym of TAG, existing questions
+    # are moved to TAG with 'flask merge-tag-synonyms'
+    alias = normalize_tag(alias)
+    tag = normalize_tag(tag)
+    if not alias or not tag or alias == tag:
+        raise click.BadParameter('Alias and tag must be different tags.')
+
+    if db.session.query(TagSynonym).filter_by(alias=tag).first():
+        raise click.BadParameter(f'"{tag}" is itself a synonym.')
+    if db.session.query(TagSynonym).join(Tag).\
+            filter(Tag.name == alias).first():
+        raise click.BadParameter(f'"{alias}" already has synonyms.')
+
+    canonical_tag = db.session.query(Tag).filter_by(name=tag).first()
+    if not canonical_tag:
+        canonical_tag = Tag(name=tag)
+        db.session.add(canonical_tag)
+
+    synonym = db.session.query(TagSynonym).filter_by(alias=alias).first()
+    if synonym:
+        synonym.tag = canonical_tag
+    else:
+        db.session.add(TagSynonym(alias=alias, tag=canonical_tag))
+    db.session.commit()
+    click.echo(f'"{alias}" is a synonym of "{tag}".')
+
+
+@click.command('merge-tag-synonyms')
+@click.option('--batch-size', default=500, show_default=True)
+def merge_tag_synonyms(batch_size):
+    # Moves questions from tags that are aliases to their canonical
+    # tags and deletes alias tags, so that listings are not split
+    synonyms = db.session.execute(
+        select(Tag.id, TagSynonym.tag_id).
+        join(TagSynonym, TagSynonym.alias == Tag.name)).all()
+
+    merged = 0
+    for alias_tag_id, canonical_tag_id in synonyms:
+        merged += merge_tag(alias_tag_id, canonical_tag_id, batch_size)
+        db.session.execute(delete(Tag).where(Tag.id == alias_tag_id))
+        db.session.commit()
+    click.echo(f'Merged {len(synonyms)} tags, '
+               f'moved {merged} tagged questions.')
+
+
+tag_synonyms = TagSynonyms()
@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+import click
+from sqlalchemy import select
+from sqlalchemy.orm import Session, undefer
+
+from . import db
+from .models import Question, QuestionViews
+from .sqlite import write_transaction
+
+
+# HyperLogLog sketch with 2^12 one-byte registers: 4 KB per
+# question and standard error of about 1.04 / sqrt(4096) = 1.6%
+# for any number of unique viewers
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+logger = logging.getLogger(__name__)
+
+
+def visitor_hash(visitor: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(visitor.encode(), digest_size=8).digest(), 'big')
+
+
+def add_to_sketch(sketch: bytearray, hashed: int):
+    # First PRECISION bits of hash select register, register keeps
+    # maximal position of the first 1-bit among the rest of bits
+    index = hashed >> (64 - PRECISION)
+    rest = hashed & ((1 << (64 - PRECISION)) - 1)
+    rank = (64 - PRECISION) - rest.bit_length() + 1
+    if rank > sketch[index]:
+        sketch[index] = rank
+
+
+def merge_sketches(sketch: bytearray, other: bytes):
+    for index, rank in enumerate(other):
+        if rank > sketch[index]:
+            sketch[index] = rank
+
+
+def estimate(sketch: bytes) -> int:
+    harmonic_sum = math.fsum(2.0 ** -rank for rank in sketch)
+    result = ALPHA * REGISTERS * REGISTERS / harmonic_sum
+    zero_registers = sketch.count(0)
+    # Small numbers of viewers are estimated by linear counting
+    if result <= 2.5 * REGISTERS and zero_registers:
+        result = REGISTERS * math.log(REGISTERS / zero_registers)
+    return round(result)
+
+
+class ViewCounter:
+    # Counter of unique viewers of questions, both authenticated and
+    # anonymous. Views are buffered in every worker as hashes of
+    # visitors and merged into sketches stored in 'question' table in
+    # batches: when buffer grows large enough or gets old enough.
+    # Estimated number of unique viewers is stored next to sketch,
+    # so pages show it without reading sketches. Views that failed to
+    # be saved are put back to buffer and saved with the next batch,
+    # views left in buffer are saved when worker exits
+
+    def __init__(self):
+        self.buffer_size = 1000
+        self.flush_interval = 30
+        self._lock = threading.Lock()
+        self._buffer = {}
+        self._buffered = 0
+        self._flushed_at = time.monotonic()
+        # After failed flush, the next one is not tried
+        # on every view until the interval passes
+        self._retry_at = 0.0
+        self._app = None
+
+    def init_app(self, app):
+        self._app = app
+        self.buffer_size = app.config.get('VIEWS_BUFFER_SIZE',
+                                          self.buffer_size)
+        self.flush_interval = app.config.get('VIEWS_FLUSH_INTERVAL',
+                                             self.flush_interval)
+        app.cli.add_command(import_question_views)
+
+    def record(self, question_id: int, visitor: str):
+        with self._lock:
+            hashes = self._buffer.setdefault(question_id, set())
+            hashed = visitor_hash(visitor)
+            if hashed not in hashes:
+                hashes.add(hashed)
+                self._buffered += 1
+            now = time.monotonic()
+            due = now >= self._retry_at and (
+                self._buffered >= self.buffer_size or
+                now - self._flushed_at >= self.flush_interval)
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            buffer = self._buffer
+            self._buffer = {}
+            self._buffered = 0
+            self._flushed_at = time.monotonic()
+
+        if not buffer:
+            return
+
+        try:
+            self._save(buffer)
+        except Exception:
+            logger.exception('Views of %d questions were not saved, '
+                             'they are kept for the next flush.', len(buffer))
+            with self._lock:
+                for question_id, hashes in buffer.items():
+                    buffered = self._buffer.setdefault(question_id, set())
+                    self._buffered += len(hashes - buffered)
+                    buffered.update(hashes)
+                self._retry_at = time.monotonic() + self.flush_interval
+
+    def close(self):
+        # Saves views left in buffer when worker exits,
+        # see 'worker_exit' in 'gunicorn.conf.py'
+        if self._app is not None:
+            with self._app.app_context():
+                self.flush()
+
+    def _save(self, buffer: dict[int, set[int]]):
+        # Sketches are merged in a separate transaction, not in the one
+        # of request. Rows are locked, so that sketches are not
+        # overwritten by other workers flushing at the same time, and
+        # in order of ids, so that workers do not deadlock on them
+        with Session(db.engine) as flush_session:
+            write_transaction(flush_session)
+            questions = flush_session.execute(
+                select(Question).filter(Question.id.in_(buffer)).
+                options(undefer(Question.views_sketch)).
+                order_by(Question.id).with_for_update()).scalars()
+            for question in questions:
+                sketch = bytearray(question.views_sketch or bytes(REGISTERS))
+                for hashed in buffer[question.id]:
+                    add_to_sketch(sketch, hashed)
+                question.views_sketch = bytes(sketch)
+                question.views = estimate(sketch)
+            flush_session.commit()
+
+
+@click.command('import-question-views')
+def import_question_views():
+    # Adds viewers recorded in 'question_views' table before
+    # views were counted with sketches
+    sketches = {}
+    for user_id, question_id in db.session.execute(
+            select(QuestionViews.user_id, QuestionViews.question_id)).\
+            yield_per(1000):
+        sketch = sketches.setdefault(question_id, bytearray(REGISTERS))
+        add_to_sketch(sketch, visitor_hash(f'user:{user_id}'))
+
+    for question_id, sketch in sketches.items():
+        question = db.session.get(Question, question_id,
+                                  options=[undefer(Question.views_sketch)])
+        if question.views_sketch:
+            merge_sketches(sketch, question.views_sketch)
+        question.views_sketch = bytes(sketch)
+        question.views = estimate(sketch)
+    db.session.commit()
+    click.echo(f'Imported views of {len(sketches)} questions.')
+
+
+view_counter = ViewCounter()
@@ -0,0 +1,83 @@
+# Compares gzip levels and brotli qualities on a large
+# 'questions_by_tag' page: how many bytes are saved and how much
+# CPU time it costs, and how long serving it from the compressed
+# body cache takes.
+# Run from the root of the project:
+#   python benchmarks/compression.py
+import gzip
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.models import User, Question, Tag, tagged_items
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+QUESTIONS = 500
+REPEAT = 20
+
+
+def measure(compress, body: bytes) -> tuple[int, float]:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        compressed = compress(body)
+    elapsed = (time.perf_counter() - start) / REPEAT * 1000
+    return len(compressed), elapsed
+
+
+def main():
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    app = create_app('testing')
+    app.config['COMPRESS_ENABLED'] = False
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username='author', email='author@example.com',
+                            password='password'))
+        db.session.add(Tag(id=1, name='python'))
+        db.session.execute(insert(Question), [
+            {'id': i, 'title': f'How do I do thing number {i} in Python?',
+             'user_id': 1} for i in range(1, QUESTIONS + 1)])
+        db.session.execute(insert(tagged_items), [
+            {'tag_id': 1, 'question_id': i} for i in range(1, QUESTIONS + 1)])
+        db.session.commit()
+
+        body = app.test_client().get('/tags/python/').data
+
+    print(f'Page size: {len(body)} bytes\n')
+    print(f'{"encoding":>12} {"size":>9} {"saved":>7} {"ms/response":>12}')
+
+    for level in (1, 6, 9):
+        size, elapsed = measure(
+            lambda data: gzip.compress(data, compresslevel=level, mtime=0),
+            body)
+        print(f'{"gzip " + str(level):>12} {size:>9} '
+              f'{1 - size / len(body):>7.1%} {elapsed:>12.3f}')
+
+    if brotli is not None:
+        for quality in (1, 5, 11):
+            size, elapsed = measure(
+                lambda data: brotli.compress(data, quality=quality), body)
+            print(f'{"br " + str(quality):>12} {size:>9} '
+                  f'{1 - size / len(body):>7.1%} {elapsed:>12.3f}')
+    else:
+        print(f'{"br":>12} brotli is not installed')
+
+    # Cache hit costs only hashing of the body
+    _, elapsed = measure(
+        lambda data: hashlib.blake2b(data, digest_size=16).digest(), body)
+    print(f'\nCompressed body cache hit: {elapsed:.3f} ms/response')
+
+
+if __name__ == '__main__':
+    main()
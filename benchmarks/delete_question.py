@@ -0,0 +1,93 @@
+# Measures how long it takes to delete a question depending on
+# how many answers, votes and views it has, and how many SQL
+# statements are issued for it.
+# Run from the root of the project:
+#   python benchmarks/delete_question.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, insert
+
+from app import create_app, db
+from app.models import (User, Question, Tag, Answer, QuestionViews,
+                        QuestionVote, AnswerVote, tagged_items)
+
+
+SIZES = [10, 100, 1000, 5000]
+
+
+def create_users(count: int):
+    db.session.execute(insert(User), [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+         'password': 'password'}
+        for i in range(1, count + 1)
+    ])
+
+
+def create_question(size: int) -> int:
+    # Question with 'size' answers, every answer has 3 votes,
+    # question itself has 'size' votes and 'size' views
+    question = Question(title='Question to delete', details='Details',
+                        user_id=1)
+    tag = Tag(name=f'tag-{size}')
+    db.session.add_all([question, tag])
+    db.session.flush()
+
+    db.session.execute(insert(tagged_items), [
+        {'tag_id': tag.id, 'question_id': question.id}])
+    db.session.execute(insert(QuestionVote), [
+        {'user_id': i, 'question_id': question.id, 'is_upvote': i % 2 == 0}
+        for i in range(1, size + 1)])
+    db.session.execute(insert(QuestionViews), [
+        {'user_id': i, 'question_id': question.id}
+        for i in range(1, size + 1)])
+    db.session.execute(insert(Answer), [
+        {'content': 'Answer content', 'user_id': i, 'question_id': question.id}
+        for i in range(1, size + 1)])
+    answer_ids = db.session.execute(
+        db.select(Answer.id).filter_by(question_id=question.id)).scalars().all()
+    db.session.execute(insert(AnswerVote), [
+        {'user_id': user_id, 'answer_id': answer_id, 'is_upvote': True}
+        for answer_id in answer_ids for user_id in range(1, 4)])
+    db.session.commit()
+    return question.id
+
+
+def main():
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        create_users(max(SIZES))
+        db.session.commit()
+
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *args: statements.append(args[2]))
+
+        print(f'{"answers":>8} {"rows":>8} {"statements":>11} {"time, ms":>10}')
+        for size in SIZES:
+            question_id = create_question(size)
+            rows = 1 + size * 6 + 1
+            db.session.expunge_all()
+            statements.clear()
+
+            start = time.perf_counter()
+            # The same what 'delete_question' view does
+            question = db.session.query(Question).\
+                filter_by(id=question_id).first()
+            db.session.delete(question)
+            db.session.commit()
+            elapsed = (time.perf_counter() - start) * 1000
+
+            assert db.session.query(Answer).\
+                filter_by(question_id=question_id).count() == 0
+            print(f'{size:>8} {rows:>8} {len(statements):>11} {elapsed:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
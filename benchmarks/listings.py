@@ -0,0 +1,99 @@
+# Compares loading questions for listing pages as full ORM objects
+# with joined users and tags against narrow column projections mapped
+# into QuestionRow objects with tags selected in one batched query:
+# time and peak memory per listed question.
+# Run from the root of the project:
+#   python benchmarks/listings.py
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.main import load_question_rows, select_question_rows
+from app.models import User, Question, Tag, tagged_items
+
+
+QUESTIONS = 2000
+TAGS_PER_QUESTION = 3
+DETAILS_SIZE = 2000
+REPEAT = 5
+
+
+def load_objects():
+    # How listings loaded questions before
+    return db.session.query(Question).\
+        options(db.undefer(Question.views_sketch),
+                db.joinedload(Question.tags),
+                db.joinedload(Question.user)).\
+        order_by(Question.asked.desc()).all()
+
+
+def load_rows():
+    return load_question_rows(
+        select_question_rows().order_by(Question.asked.desc()))
+
+
+def measure(load) -> tuple[float, float]:
+    timings = []
+    for _ in range(REPEAT):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        load()
+        timings.append(time.perf_counter() - start)
+
+    db.session.expunge_all()
+    tracemalloc.start()
+    questions = load()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del questions
+    return min(timings) / QUESTIONS * 1e6, peak / QUESTIONS
+
+
+def main():
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username='author', email='author@example.com',
+                            password='password'))
+        db.session.execute(insert(Tag), [
+            {'id': i, 'name': f'tag-{i}'} for i in range(1, 51)])
+        # Questions as they are after views were counted and Markdown
+        # was rendered: details, their HTML and sketch of viewers
+        db.session.execute(insert(Question), [
+            {'id': i, 'title': f'How do I do thing number {i} in Python?',
+             'details': 'x' * DETAILS_SIZE,
+             'details_html': f'<p>{"x" * DETAILS_SIZE}</p>',
+             'views_sketch': bytes(4096), 'views': i, 'user_id': 1}
+            for i in range(1, QUESTIONS + 1)])
+        db.session.execute(insert(tagged_items), [
+            {'tag_id': (i + j) % 50 + 1, 'question_id': i}
+            for i in range(1, QUESTIONS + 1)
+            for j in range(TAGS_PER_QUESTION)])
+        db.session.commit()
+
+        print(f'{QUESTIONS} questions with {TAGS_PER_QUESTION} tags, '
+              f'{DETAILS_SIZE} characters of details\n')
+        print(f'{"loaded as":>12} {"us/question":>12} {"bytes/question":>15}')
+        results = {}
+        for name, load in (('ORM objects', load_objects),
+                           ('rows', load_rows)):
+            results[name] = measure(load)
+            elapsed, memory = results[name]
+            print(f'{name:>12} {elapsed:>12.1f} {memory:>15.0f}')
+
+        (objects_time, objects_memory), (rows_time, rows_memory) = \
+            results.values()
+        print(f'\nRows are {objects_time / rows_time:.1f}x faster and take '
+              f'{objects_memory / rows_memory:.1f}x less memory.')
+
+
+if __name__ == '__main__':
+    main()
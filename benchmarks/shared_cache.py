@@ -0,0 +1,156 @@
+# Compares cache shared by workers in memory-mapped file
+# ('app/shared_cache.py') with dictionary in every worker: time of
+# get and set in one process, and number of misses (values built)
+# and memory held when several processes read the same hot keys,
+# like gunicorn workers rendering the home page and loading users.
+# Run from the root of the project:
+#   python benchmarks/shared_cache.py
+import multiprocessing
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.shared_cache import SharedCache, FILE_HEADER, SLOT_HEADER
+
+
+KEYS = 2000
+VALUE_SIZE = 500
+OPERATIONS = 100000
+WORKERS = 4
+REQUESTS_PER_WORKER = 20000
+# Time it takes to build a missed value, like a query
+BUILD_TIME = 0.0005
+
+
+def value_of(key: str) -> dict:
+    return {'key': key, 'payload': 'x' * VALUE_SIZE}
+
+
+def create_cache(path: str) -> SharedCache:
+    cache = SharedCache()
+    cache.enabled = True
+    cache.path = path
+    return cache
+
+
+def held_bytes(cache: SharedCache) -> int:
+    # Size of values in the file that did not expire
+    cache._open()
+    now = time.time()
+    held = 0
+    for set_index in range(cache.sets):
+        set_start = FILE_HEADER.size + set_index * cache.set_size
+        for slot in cache._slots(set_start):
+            _, expires, _, length = SLOT_HEADER.unpack_from(cache._map, slot)
+            if expires > now:
+                held += length
+    return held
+
+
+def measure(operation, keys: list[str]) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        operation(key)
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+
+class DictCache:
+    # Per-process cache as views would have it without shared one
+
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, key: str, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            return default
+        return entry[1]
+
+    def set(self, key: str, value, ttl: float = 60):
+        self._entries[key] = (time.time() + ttl, value)
+
+    def get_or_set(self, key: str, build, ttl: float = 60):
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.set(key, value, ttl)
+        return value
+
+    def size(self) -> int:
+        return sum(len(pickle.dumps(value))
+                   for _, value in self._entries.values())
+
+
+def worker(kind: str, path: str, seed: int, results):
+    random.seed(seed)
+    cache = create_cache(path) if kind == 'shared' else DictCache()
+    built = 0
+
+    def build(key):
+        nonlocal built
+        built += 1
+        time.sleep(BUILD_TIME)
+        return value_of(key)
+
+    start = time.perf_counter()
+    for _ in range(REQUESTS_PER_WORKER):
+        # A few keys are much hotter than the others
+        key = f'user:{int(random.paretovariate(1.2)) % KEYS}'
+        cache.get_or_set(key, lambda: build(key))
+    elapsed = time.perf_counter() - start
+    size = cache.size() if kind == 'dict' else 0
+    results.put((built, elapsed, size))
+
+
+def measure_workers(kind: str, path: str) -> tuple[int, float, int]:
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    workers = [context.Process(target=worker,
+                               args=(kind, path, seed, results))
+               for seed in range(WORKERS)]
+    for process in workers:
+        process.start()
+    outcomes = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    built = sum(outcome[0] for outcome in outcomes)
+    elapsed = max(outcome[1] for outcome in outcomes)
+    size = sum(outcome[2] for outcome in outcomes)
+    return built, elapsed, size
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    keys = [f'user:{random.randrange(KEYS)}' for _ in range(OPERATIONS)]
+
+    dict_cache = DictCache()
+    shared = create_cache(os.path.join(directory, 'single'))
+    print(f'{KEYS} keys, values of {VALUE_SIZE} bytes, '
+          f'{OPERATIONS} operations\n')
+    print(f'{"operation":>12} {"dict us":>10} {"shared us":>10}')
+    for name, dict_operation, shared_operation in (
+            ('set', lambda key: dict_cache.set(key, value_of(key)),
+             lambda key: shared.set(key, value_of(key))),
+            ('get', dict_cache.get, shared.get)):
+        print(f'{name:>12} {measure(dict_operation, keys):>10.2f} '
+              f'{measure(shared_operation, keys):>10.2f}')
+
+    print(f'\n{WORKERS} processes, {REQUESTS_PER_WORKER} requests each, '
+          f'{BUILD_TIME * 1000:.1f} ms to build missed value:\n')
+    print(f'{"cache":>8} {"built":>8} {"seconds":>8} {"held bytes":>12}')
+    path = os.path.join(directory, 'workers')
+    for kind in ('dict', 'shared'):
+        built, elapsed, size = measure_workers(kind, path)
+        if kind == 'shared':
+            # One copy in file, whatever the number of workers
+            size = held_bytes(create_cache(path))
+        print(f'{kind:>8} {built:>8} {elapsed:>8.2f} {size:>12}')
+
+
+if __name__ == '__main__':
+    main()
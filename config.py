@@ -21,6 +21,144 @@ class Config:
     SQLALCHEMY_ECHO = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Number of answers shown on one page of question's page
+    ANSWERS_PER_PAGE = 20
+
+    # Listings of questions are read from the database in batches,
+    # with LISTINGS_STREAMING they are also sent to client while
+    # they are rendered (LISTINGS_STREAM_BUFFER template pieces at once)
+    LISTINGS_STREAMING = os.getenv('LISTINGS_STREAMING') == 'True'
+    LISTINGS_BATCH_SIZE = 100
+    LISTINGS_STREAM_BUFFER = 50
+
+    # Number of questions shown on one page of unanswered questions
+    UNANSWERED_PER_PAGE = 30
+
+    # Number of users shown on one page of leaderboard
+    USERS_PER_PAGE = 50
+
+    # Related questions shown on question's page
+    RELATED_QUESTIONS_COUNT = 5
+    RELATED_QUESTIONS_BATCH_SIZE = 1000
+    # Only the newest questions of every tag are candidates
+    RELATED_QUESTIONS_CANDIDATES_PER_TAG = 1000
+    RELATED_QUESTIONS_REBUILD_INTERVAL = 600
+
+    # Similar questions suggested while a question is written
+    DUPLICATES_THRESHOLD = 0.5
+    DUPLICATES_COUNT = 5
+    DUPLICATES_REBUILD_INTERVAL = 600
+
+    # Unique viewers of questions are buffered in every worker
+    # and saved when there are VIEWS_BUFFER_SIZE of them or
+    # when VIEWS_FLUSH_INTERVAL seconds passed
+    VIEWS_BUFFER_SIZE = 1000
+    VIEWS_FLUSH_INTERVAL = 30
+
+    # Cache of search results
+    SEARCH_CACHE_SIZE = 1000
+    SEARCH_CACHE_TTL = 60
+
+    # Cache shared by all workers of a node in memory-mapped file,
+    # SHARED_CACHE_SLOTS slots of SHARED_CACHE_SLOT_SIZE bytes,
+    # see 'app/shared_cache.py'. Workers that share the file
+    # must use the same settings. File is 'shared_cache' in instance
+    # folder unless SHARED_CACHE_PATH is set, its directory must not
+    # be writable by other users
+    SHARED_CACHE_ENABLED = os.getenv('SHARED_CACHE_ENABLED', 'True') == 'True'
+    SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH')
+    SHARED_CACHE_SLOTS = 2048
+    SHARED_CACHE_WAYS = 8
+    SHARED_CACHE_SLOT_SIZE = 16 * 1024
+    SHARED_CACHE_TTL = 60
+
+    # Maximum number of tags suggested for a prefix
+    TAG_SUGGESTIONS_LIMIT = 10
+    # How often every worker rebuilds tag suggestions in background,
+    # to see tags of other workers
+    TAG_SUGGESTIONS_RELOAD_INTERVAL = 600
+
+    # How often every worker reloads synonyms of tags in background
+    TAG_SYNONYMS_RELOAD_INTERVAL = 60
+
+    # Compression of responses, brotli is used when
+    # 'brotli' package is installed and client accepts it
+    COMPRESS_ENABLED = True
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 5
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_CACHE_SIZE = 256
+    COMPRESS_MIMETYPES = {'text/html', 'text/css', 'text/xml',
+                          'application/json', 'application/javascript',
+                          'application/xml', 'application/atom+xml'}
+
+    # Atom feeds of tags and users
+    FEED_ENTRIES = 20
+    FEED_CACHE_SIZE = 500
+    FEED_MAX_AGE = 60
+
+    # Number of proxies in front of the application, address of client
+    # and scheme are taken from X-Forwarded-For and X-Forwarded-Proto
+    # headers they set. Without proxies it must be 0, or clients
+    # could send any address
+    PROXY_FIX_HOPS = int(os.getenv('PROXY_FIX_HOPS', 1))
+
+    # Load shedding: request gets cheap 503 when it waited in queue of
+    # proxy (LOAD_SHEDDING_HEADER) or when worker already handles too
+    # many requests, limits depend on priority of the route. Expensive
+    # routes are shed first, so that question pages stay fast
+    LOAD_SHEDDING_ENABLED = os.getenv('LOAD_SHEDDING_ENABLED',
+                                      'True') == 'True'
+    LOAD_SHEDDING_HEADER = 'X-Request-Start'
+    LOAD_SHEDDING_RETRY_AFTER = 5
+    # Maximal queue time in seconds and number of requests in flight
+    LOAD_SHEDDING_LIMITS = {
+        'critical': {'queue_time': 10.0, 'in_flight': 64},
+        'normal': {'queue_time': 3.0, 'in_flight': 16},
+        'low': {'queue_time': 0.5, 'in_flight': 4},
+    }
+    # Priority of endpoints, others are 'normal'
+    LOAD_SHEDDING_PRIORITIES = {
+        'main.index': 'critical',
+        'main.question_detail': 'critical',
+        'metrics': 'critical',
+        'static': 'critical',
+        'main.search': 'low',
+        'main.questions_by_tag': 'low',
+        'main.similar_questions': 'low',
+        'feeds.tag_feed': 'low',
+        'feeds.user_feed': 'low',
+        'sitemap.sitemap_index': 'low',
+        'sitemap.sitemap_chunk': 'low',
+    }
+
+    # Directory where generated child sitemaps are kept
+    SITEMAP_DIR = os.getenv('SITEMAP_DIR', 'sitemaps')
+
+    # Profiling of requests, profiles are written to PROFILER_DIR
+    # for requests with signed 'X-Profile' header and for
+    # PROFILER_SAMPLE_RATE share of all other requests
+    PROFILER_ENABLED = os.getenv('PROFILER_ENABLED') == 'True'
+    PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', 0))
+    PROFILER_DIR = os.getenv('PROFILER_DIR', 'profiles')
+    PROFILER_MAX_FILES = 100
+    PROFILER_TOKEN_MAX_AGE = 3600
+
+    # Statements slower than SLOW_QUERY_THRESHOLD seconds are written
+    # to rotating logs in SLOW_QUERY_DIR, see 'flask slow-queries'
+    SLOW_QUERY_ENABLED = os.getenv('SLOW_QUERY_ENABLED', 'True') == 'True'
+    SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.2))
+    # EXPLAIN ANALYZE runs the statement once more
+    SLOW_QUERY_EXPLAIN_ANALYZE = \
+        os.getenv('SLOW_QUERY_EXPLAIN_ANALYZE') == 'True'
+    # Parameters are not logged unless asked for, passwords,
+    # emails and the like are redacted even then
+    SLOW_QUERY_LOG_PARAMETERS = \
+        os.getenv('SLOW_QUERY_LOG_PARAMETERS') == 'True'
+    SLOW_QUERY_DIR = os.getenv('SLOW_QUERY_DIR', 'slow_queries')
+    SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+    SLOW_QUERY_LOG_BACKUPS = 5
+
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -30,14 +168,47 @@ class ProductionConfig(Config):
     pass
 
 
+class SQLiteConfig(Config):
+    # Production on a local SQLite file, for small nodes
+    # without PostgreSQL: gunicorn 'app:create_app("sqlite")'
+    SQLITE_PATH = os.path.abspath(os.getenv('SQLITE_PATH', 'asklee.sqlite3'))
+    SQLALCHEMY_DATABASE_URI = f'sqlite:///{SQLITE_PATH}'
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        # Connection is used by one thread at a time,
+        # but may be returned to pool by another one
+        'connect_args': {'check_same_thread': False},
+    }
+    # Set on every new connection, see 'app/sqlite.py'.
+    # In WAL mode readers are not blocked by the writer, and with
+    # synchronous=NORMAL commit does not wait for fsync (transactions
+    # committed just before power loss may be lost, but database
+    # is not corrupted). Writers wait for lock up to busy_timeout ms
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        # Negative value is size in KiB
+        'cache_size': -64 * 1024,
+        'temp_store': 'MEMORY',
+    }
+
+
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    PROXY_FIX_HOPS = 0
+    # All threads share one connection to in-memory database,
+    # so indexes are rebuilt in the request that needs them
+    INDEXES_REBUILD_IN_BACKGROUND = False
+    SLOW_QUERY_ENABLED = False
+    SHARED_CACHE_ENABLED = False
 
 
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
-    'production': ProductionConfig
+    'production': ProductionConfig,
+    'sqlite': SQLiteConfig
 }
@@ -0,0 +1,35 @@
+import os
+import shutil
+
+
+def on_starting(server):
+    # Metrics of previous run must not be summed with new ones
+    metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # In-memory indexes are built in background as soon as worker
+    # has loaded the application, not when a request needs them
+    from app.duplicates import duplicate_detector
+    from app.related import related_questions
+    from app.tag_suggestions import tag_suggestions
+    from app.tag_synonyms import tag_synonyms
+    duplicate_detector.refresh()
+    related_questions.refresh()
+    tag_suggestions.refresh()
+    tag_synonyms.refresh()
+
+
+def worker_exit(server, worker):
+    # Called in worker process, views it buffered are not lost
+    from app.view_counter import view_counter
+    view_counter.close()
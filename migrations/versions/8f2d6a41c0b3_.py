@@ -0,0 +1,86 @@
+"""add ON DELETE CASCADE and indexes to foreign keys
+
+Revision ID: 8f2d6a41c0b3
+Revises: 3c9e1f7b2d45
+Create Date: 2026-10-19 11:02:47.915362
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2d6a41c0b3'
+down_revision = '3c9e1f7b2d45'
+branch_labels = None
+depends_on = None
+
+
+# Foreign keys were created without names, so they are addressed by
+# names PostgreSQL gives them by default ('<table>_<column>_fkey'),
+# the same convention is used to name them on SQLite batch rebuilds
+naming_convention = {
+    'fk': '%(table_name)s_%(column_0_name)s_fkey',
+}
+
+foreign_keys = [
+    ('question', 'user', 'user_id'),
+    ('answer', 'question', 'question_id'),
+    ('answer', 'user', 'user_id'),
+    ('question_views', 'question', 'question_id'),
+    ('question_views', 'user', 'user_id'),
+    ('question_vote', 'question', 'question_id'),
+    ('question_vote', 'user', 'user_id'),
+    ('tagged_items', 'question', 'question_id'),
+    ('tagged_items', 'tag', 'tag_id'),
+    ('answer_vote', 'answer', 'answer_id'),
+    ('answer_vote', 'user', 'user_id'),
+]
+
+# Cascading delete looks rows up in child tables by foreign key,
+# so every foreign key column that is not leading column of some
+# primary key or unique constraint gets an index
+indexes = [
+    ('question', 'user_id'),
+    ('answer', 'question_id'),
+    ('answer', 'user_id'),
+    ('question_views', 'question_id'),
+    ('question_vote', 'question_id'),
+    ('tagged_items', 'question_id'),
+    ('tagged_items', 'tag_id'),
+    ('answer_vote', 'answer_id'),
+]
+
+
+def recreate_foreign_keys(ondelete):
+    # SQLite alters tables by copying them, dropping a referenced
+    # table must not be checked against (or cascade to) other tables
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    if sqlite:
+        with op.get_context().autocommit_block():
+            op.execute('PRAGMA foreign_keys=OFF')
+
+    for table, referred_table, column in foreign_keys:
+        name = f'{table}_{column}_fkey'
+        with op.batch_alter_table(table, schema=None,
+                                  naming_convention=naming_convention) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(name, referred_table,
+                                        [column], ['id'], ondelete=ondelete)
+
+    if sqlite:
+        with op.get_context().autocommit_block():
+            op.execute('PRAGMA foreign_keys=ON')
+
+
+def upgrade():
+    recreate_foreign_keys(ondelete='CASCADE')
+    for table, column in indexes:
+        op.create_index(op.f(f'ix_{table}_{column}'), table, [column],
+                        unique=False)
+
+
+def downgrade():
+    for table, column in indexes:
+        op.drop_index(op.f(f'ix_{table}_{column}'), table_name=table)
+    recreate_foreign_keys(ondelete=None)